@@ -21,14 +21,18 @@
 
 """
 
-from unittest import TestCase
+from unittest import TestCase, mock
 
+import json
 import os
 from pathlib import Path
 import shutil
+import socket
 import sys
 import subprocess as sub
 import tempfile
+import threading
+import time
 import typing as ty
 
 import zen
@@ -51,6 +55,7 @@ MAIN_CC_PATH = Path(FAKE_PROJECT_PATH, 'main.cc')
 TEST_SOURCE_DIR_PATH = Path(TEST_RESOURCES_PATH, 'test_source_dir_1')
 ALTERNATE_SAMPLE_H_PATH = Path(TEST_RESOURCES_PATH, 'alternate_sample.h')
 ALTERNATE_HELLO_H_PATH = Path(TEST_RESOURCES_PATH, 'alternate_hello.h')
+CHANGED_SAMPLE_H_PATH = Path(TEST_RESOURCES_PATH, 'changed_sample.h')
 
 CHANGED_HELLO_CC_PATH = Path(TEST_RESOURCES_PATH, 'changed_hello.cc')
 BROKEN_HELLO_CC_PATH = Path(TEST_RESOURCES_PATH, 'broken_hello.cc')
@@ -71,6 +76,22 @@ def get_output_content_dict():
 _out: ty.Dict[str, bytes] = get_output_content_dict()
 
 
+def copy_sample_project(temp_dir: str) -> Path:
+    """
+    Copies sample project into passed directory, with the source paths
+    of its build dir updated to refer to the copy.
+    :param temp_dir: directory to copy project into.
+    :return: path to copied project.
+    """
+    project_dir = Path(temp_dir, 'sample_project_1')
+    shutil.copytree(str(SAMPLE_PROJECT_PATH), str(project_dir))
+    for depend_path in Path(project_dir, 'build').rglob('depend.internal'):
+        s = depend_path.read_text()
+        depend_path.write_text(
+            s.replace(str(FAKE_PROJECT_PATH), str(project_dir)))
+    return project_dir
+
+
 class TestBuildDir(TestCase):
     def tearDown(self):
         zen.clear()
@@ -89,6 +110,29 @@ class TestBuildDir(TestCase):
         self.assertIn(zen.SourceFile(SAMPLE_CC_PATH), build_dir.sources)
         self.assertIn(zen.SourceFile(MAIN_CC_PATH), build_dir.sources)
 
+    def test_dependent_objects_are_indexed_by_source(self):
+        build_dir = zen.BuildDir(SAMPLE_BUILD_DIR)
+        dependents = build_dir.dependents[zen.SourceFile(SAMPLE_H_PATH)]
+        self.assertEqual(
+            {'main.cc.o', 'sample.cc.o'},
+            {obj.path.name for obj in dependents}
+        )
+
+    def test_only_dependents_of_modified_sources_are_modified(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_dir = zen.BuildDir(Path(project_dir, 'build'))
+            for source in build_dir.sources:
+                os.utime(str(source.path), (50, 50))
+            for target in build_dir.targets.values():
+                for obj in target.objects:
+                    os.utime(str(obj.path), (100, 100))
+            os.utime(str(Path(project_dir, 'sample.h')), (200, 200))
+            self.assertEqual(
+                {'main.cc.o', 'sample.cc.o'},
+                {obj.path.name for obj in build_dir.modified_objects()}
+            )
+
     def test_meditation_prevents_doc_edit_from_causing_rebuild(self):
         original_dir = os.curdir
         try:
@@ -409,6 +453,208 @@ class TestBuildDir(TestCase):
         self.assertEqual(_out['no_rebuild'], second_out)
         self.assertEqual(_out['hello_rebuild'], last_out)
 
+    def test_avoided_files_are_updated_after_newest_dependency(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = Path(temp_dir, 'sample_project_1')
+            shutil.copytree(str(SAMPLE_PROJECT_PATH), str(project_dir))
+            build_dir = zen.BuildDir(
+                Path(project_dir, 'build'), precise_m_time=True)
+            source_path = Path(project_dir, 'sample.cc')
+            obj_path = Path(build_dir.path, 'a.o')
+            lib_path = Path(build_dir.path, 'liba.a')
+            for path in (obj_path, lib_path):
+                path.touch()
+                os.utime(str(path), ns=(100, 100))
+            os.utime(str(source_path), ns=(500, 500))
+            build_dir.avoid_build(obj_path, [source_path])
+            build_dir.avoid_build(lib_path, [obj_path])
+            build_dir.avoid_build(Path(build_dir.path, 'missing'))
+            self.assertEqual(501, build_dir.expected_m_time(obj_path))
+            self.assertEqual(100, os.stat(str(obj_path)).st_mtime_ns)
+            build_dir.update_avoided_m_times()
+            self.assertEqual(501, os.stat(str(obj_path)).st_mtime_ns)
+            self.assertEqual(502, os.stat(str(lib_path)).st_mtime_ns)
+            self.assertFalse(Path(build_dir.path, 'missing').exists())
+
+    def test_avoided_files_are_updated_if_meditation_fails(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = Path(temp_dir, 'sample_project_1')
+            shutil.copytree(str(SAMPLE_PROJECT_PATH), str(project_dir))
+            build_dir = zen.BuildDir(
+                Path(project_dir, 'build'), precise_m_time=True)
+            source_path = Path(project_dir, 'sample.cc')
+            obj_path = Path(build_dir.path, 'a.o')
+            obj_path.touch()
+            os.utime(str(obj_path), ns=(100, 100))
+            os.utime(str(source_path), ns=(500, 500))
+            build_dir.avoid_build(obj_path, [source_path])
+
+            def fail():
+                raise zen.ParsingException('Failed')
+
+            build_dir.modified_objects = fail
+            with self.assertRaises(zen.ParsingException):
+                build_dir.meditate()
+            self.assertEqual(501, os.stat(str(obj_path)).st_mtime_ns)
+
+    def test_hashes_from_worker_processes_match_serial_hashes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+
+            def object_hashes(jobs: int) -> ty.Dict[str, int]:
+                zen.clear()
+                build_dir = zen.BuildDir(
+                    Path(project_dir, 'build'), jobs=jobs)
+                objects = [obj for target in build_dir.targets.values()
+                           for obj in target.objects]
+                if jobs > 1:
+                    build_dir.hash_objects(objects)
+                return {obj.path.name: obj.used_content_hash
+                        for obj in objects}
+
+            self.assertEqual(object_hashes(1), object_hashes(2))
+
+    def test_remember_only_hashes_changed_sources_and_objects(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            zen.BuildDir(build_path).remember()
+            cache_path = Path(build_path, zen.SqliteHashStore.FILE_NAME)
+            cache_stat = zen.FileStat.of(cache_path)
+
+            zen.clear()
+            zen.BuildDir(build_path).remember()
+            self.assertEqual(cache_stat, zen.FileStat.of(cache_path))
+
+            zen.clear()
+            shutil.copy(
+                str(CHANGED_HELLO_CC_PATH),
+                str(Path(project_dir, 'hello', 'hello.cc'))
+            )
+            build_dir = zen.BuildDir(build_path)
+            build_dir.remember()
+            hashed = {obj.path.name for target in build_dir.targets.values()
+                      for obj in target.objects if obj.hashed}
+            self.assertEqual({'hello.cc.o'}, hashed)
+
+    def test_remember_stores_trees_of_headers(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            zen.BuildDir(build_path).remember()
+
+            zen.clear()
+            header = zen.SourceFile(Path(project_dir, 'sample.h'))
+            source = zen.SourceFile(Path(project_dir, 'sample.cc'))
+            build_dir = zen.BuildDir(build_path)
+            trees = build_dir.store.trees
+            self.assertEqual(set(), header.changed_constructs(trees))
+            self.assertNotIn(source.hex, trees)
+
+    def test_remembered_hash_is_kept_if_no_used_construct_changed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            header_path = Path(project_dir, 'hello', 'hello.h')
+            header = header_path.read_text()
+            header_path.write_text(
+                header + 'inline int helper() { return 1; }\n')
+            zen.BuildDir(build_path).remember()
+
+            def main_object_hash(header_text: str) -> int:
+                zen.clear()
+                header_path.write_text(header_text)
+                build_dir = zen.BuildDir(build_path)
+                obj, = [obj for target in build_dir.targets.values()
+                        for obj in target.objects
+                        if obj.path.name == 'main.cc.o']
+                build_dir.store.hashes[obj.hex] = remembered_hash
+                return obj.used_content_hash
+
+            remembered_hash = bytes(zen.HASH_SIZE)
+            self.assertEqual(remembered_hash, main_object_hash(
+                header + 'inline int helper() { return 2; }\n'))
+            self.assertNotEqual(remembered_hash, main_object_hash(
+                header + 'int helper();\n'))
+
+    def test_change_to_transitively_called_inline_body_causes_rebuild(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            sample_path = Path(project_dir, 'sample.h')
+            hello_path = Path(project_dir, 'hello', 'hello.h')
+            hello = hello_path.read_text()
+            sample_path.write_text(sample_path.read_text().replace(
+                'namespace sample {',
+                'inline int f() { return g(); }\nnamespace sample {'))
+            hello_path.write_text(hello + 'inline int g() { return 1; }\n')
+            zen.BuildDir(build_path).remember()
+
+            zen.clear()
+            hello_path.write_text(hello + 'inline int g() { return 2; }\n')
+            build_dir = zen.BuildDir(build_path)
+            build_dir.meditate()
+            obj, = [obj for target in build_dir.targets.values()
+                    for obj in target.objects
+                    if obj.path.name == 'main.cc.o']
+            self.assertEqual(zen.Status.CHANGED, obj.status)
+
+            zen.clear()
+            build_dir = zen.BuildDir(build_path)
+            obj, = [obj for target in build_dir.targets.values()
+                    for obj in target.objects
+                    if obj.path.name == 'main.cc.o']
+            self.assertIsNone(obj._remembered_hash())
+
+    def test_source_with_unchanged_bytes_is_not_read_as_text(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            zen.BuildDir(build_path).remember()
+
+            zen.clear()
+            header_path = Path(project_dir, 'hello', 'hello.h')
+            os.utime(str(header_path), ns=(1, 2 ** 62))
+            build_dir = zen.BuildDir(build_path)
+            header = zen.SourceFile(header_path)
+            self.assertFalse(header.substantive_changes(build_dir.store))
+            self.assertIsNone(header._content)
+
+            header_path.write_text(header_path.read_text() + '\n')
+            build_dir.reset()
+            self.assertFalse(header.bytes_unchanged(build_dir.store))
+
+
+class TestScheduler(TestCase):
+    def tearDown(self):
+        zen.clear()
+
+    def test_graph_contains_objects_and_libraries_of_targets(self):
+        build_dir = zen.BuildDir(SAMPLE_BUILD_DIR)
+        scheduler = zen.Scheduler(build_dir)
+        target = build_dir.targets['sample_target']
+        self.assertIn(build_dir.targets['hello'], scheduler.inputs[target])
+        self.assertEqual(3, len(scheduler.inputs[target]))
+        self.assertEqual(
+            [target], scheduler.dependents[build_dir.targets['hello']])
+
+    def test_targets_are_resolved_after_their_inputs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_dir = zen.BuildDir(Path(project_dir, 'build'))
+            scheduler = zen.Scheduler(build_dir)
+            scheduler.run(set())
+            target = build_dir.targets['sample_target']
+            library = build_dir.targets['hello']
+            self.assertEqual(zen.Status.NO_CHANGE, target.status)
+            self.assertLessEqual(
+                scheduler.finish_times[library],
+                scheduler.finish_times[target]
+            )
+            path = scheduler.critical_path()
+            self.assertIs(target, path[-1])
+            self.assertIsInstance(path[0], zen.CompileObject)
+
 
 class TestTarget(TestCase):
     def tearDown(self):
@@ -423,6 +669,13 @@ class TestTarget(TestCase):
         target = build_dir.targets['sample_target']
         self.assertIn(build_dir.targets['hello'], target.lib_dependencies)
 
+    def test_library_target_finds_dependencies(self):
+        build_dir = zen.BuildDir(SAMPLE_BUILD_DIR)
+        target = build_dir.targets['hello']
+        obj_path = Path(
+            build_dir.path, 'hello', 'CMakeFiles', 'hello.dir', 'hello.cc.o')
+        self.assertIn(obj_path, target.dependency_paths)
+
     def test_target_finds_other_dependencies(self):
         build_dir = zen.BuildDir(SAMPLE_BUILD_DIR)
         target = build_dir.targets['sample_target']
@@ -434,6 +687,44 @@ class TestTarget(TestCase):
         self.assertIn(link_file_path, target.other_dependencies)
 
 
+class TestCompileObject(TestCase):
+    def tearDown(self):
+        zen.clear()
+
+    def test_objects_share_construct_tables_of_sources(self):
+        header_path = Path(TEST_SOURCE_DIR_PATH, 'sample.h')
+        a = zen.CompileObject(Path('a.o'), [header_path], None)
+        b = zen.CompileObject(
+            Path('b.o'),
+            [header_path, Path(TEST_SOURCE_DIR_PATH, 'sample.cc')],
+            None
+        )
+        a_constructs = a.create_constructs()
+        b_constructs = b.create_constructs()
+        self.assertIn('Foo', a_constructs)
+        self.assertIs(a_constructs['Foo'], b_constructs['Foo'])
+
+    def test_used_content_hash_is_repeatable(self):
+        sources = [
+            Path(TEST_SOURCE_DIR_PATH, 'sample.h'),
+            Path(TEST_SOURCE_DIR_PATH, 'main.cc')
+        ]
+        a = zen.CompileObject(Path('a.o'), sources, None)
+        b = zen.CompileObject(Path('b.o'), sources, None)
+        self.assertEqual(a.used_content_hash, b.used_content_hash)
+
+    def test_object_is_hashed_until_source_changes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir, 'a.h')
+            path.write_text('int a;')
+            obj = zen.CompileObject(Path('a.o'), [path], None)
+            self.assertFalse(obj.hashed)
+            obj.used_content_hash
+            self.assertTrue(obj.hashed)
+            path.write_text('int ab;')
+            self.assertFalse(obj.hashed)
+
+
 class TestSourceFile(TestCase):
     def tearDown(self):
         zen.clear()
@@ -491,6 +782,25 @@ class TestSourceContent(TestCase):
         self.assertEqual('\n', content.lines[1].uncommented)
         self.assertEqual(' line', content.lines[2].uncommented)
 
+    def test_comment_delimiters_in_literals_are_not_stripped(self):
+        content = zen.SourceContent(
+            'url = "http://foo.com/*";  // comment\nc = \'/\';\n')
+        content.strip_comments()
+        self.assertEqual(
+            'url = "http://foo.com/*";  \n', content.lines[0].uncommented)
+        self.assertEqual('c = \'/\';\n', content.lines[1].uncommented)
+
+    def test_line_comment_continues_after_line_continuation(self):
+        content = zen.SourceContent('a;  // comment \\\nstill comment\nb;')
+        content.strip_comments()
+        self.assertEqual('a;  \n', content.lines[0].uncommented)
+        self.assertEqual('\n', content.lines[1].uncommented)
+        self.assertEqual('b;', content.lines[2].uncommented)
+
+    def test_comment_spans_are_reported(self):
+        content = zen.SourceContent('a; /* b */\n// c\n')
+        self.assertEqual([(3, 10), (11, 15)], content.comment_spans())
+
     def test_stripped_line_with_content_is_correct(self):
         content = zen.SourceContent('    this is a /* commented */ line\n')
         content.strip_comments()
@@ -520,6 +830,35 @@ class TestSourceContent(TestCase):
         content2.strip_comments()
         self.assertNotEqual(content1.stripped_hash, content2.stripped_hash)
 
+    def test_contiguous_text_matches_lines(self):
+        content = zen.SourceContent('This file\nhas three\nlines.')
+        self.assertEqual(
+            'This file\nhas three\nlines.',
+            content.text(zen.SourceForm.RAW)
+        )
+        self.assertEqual(
+            [0, 10, 20], list(content.line_starts(zen.SourceForm.RAW)))
+
+    def test_line_index_can_be_found_from_offset(self):
+        content = zen.SourceContent('This file\nhas three\nlines.')
+        self.assertEqual(0, content.line_index(9, zen.SourceForm.STRIPPED))
+        self.assertEqual(1, content.line_index(10, zen.SourceForm.STRIPPED))
+        self.assertEqual(2, content.line_index(26, zen.SourceForm.STRIPPED))
+
+    def test_loaded_content_matches_content_read_as_text(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir, 'a.h')
+            for data in (b'', b'int a;\r\n// b\rint c;',
+                         'int \u00e9;'.encode()):
+                path.write_bytes(data)
+                with path.open() as f:
+                    expected = zen.SourceContent(f)
+                content = zen.SourceContent.load(path)
+                self.assertEqual(
+                    [line.raw for line in expected.lines],
+                    [line.raw for line in content.lines])
+                self.assertEqual(expected.stripped_hash, content.stripped_hash)
+
     def test_preprocessor_directive_is_identified(self):
         content1 = zen.SourceContent('// Preprocessor\n#include <string>\n\n')
         self.assertIsInstance(
@@ -553,6 +892,26 @@ class TestSourceContent(TestCase):
             self.assertEqual(1, len(components[3].construct_content))
             self.assertIn('main', components[3].construct_content)
 
+    def test_quoted_semicolon_does_not_end_statement(self):
+        content = zen.SourceContent(
+            'class A {\n  std::string s_ = "{;";\n  int b;\n};\n')
+        # noinspection PyUnresolvedReferences
+        members = content.component.sub_components[0].member_components
+        self.assertEqual(2, len(members))
+        self.assertEqual('std::string s_ = "{;";', str(members[0].chunk))
+
+    def test_raw_string_does_not_break_parsing(self):
+        content = zen.SourceContent(
+            'const char* kJson = R"json({\n'
+            '  "a": [1, 2, "}"];\n'
+            '})json";\n'
+            'void Foo() { bar(); }\n'
+        )
+        components = content.component.sub_components
+        self.assertEqual(2, len(components))
+        self.assertIsInstance(components[0], zen.MiscStatement)
+        self.assertIsInstance(components[1], zen.FunctionDefinition)
+
     def test_correct_nested_components_are_found(self):
         with ALTERNATE_SAMPLE_H_PATH.open() as src_f:
             # noinspection PyTypeChecker
@@ -583,6 +942,44 @@ class TestSourceContent(TestCase):
                 zen.MiscStatement
             )
 
+    def test_construct_table_is_built_once(self):
+        with ALTERNATE_SAMPLE_H_PATH.open() as f:
+            content = zen.SourceContent(f)
+        constructs = content.constructs
+        self.assertIs(constructs, content.constructs)
+        self.assertIn('Foo', constructs)
+        self.assertIsInstance(constructs['Foo'].content, tuple)
+
+    def test_tree_finds_changed_constructs(self):
+        old = zen.SourceContent(
+            'int f() { return 1; }\nclass A {\n  int x;\n};\n')
+        changed = zen.SourceContent(
+            'int f() { return 2; }\nclass A {\n  int x;\n};\n')
+        commented = zen.SourceContent(
+            'int f() { return 1; }  // f\nclass A {\n  int x;\n};\n')
+        self.assertEqual({'f'}, changed.tree.changed_constructs(old.tree))
+        self.assertEqual(set(), commented.tree.changed_constructs(old.tree))
+
+    def test_tree_finds_change_to_body_references(self):
+        old = zen.SourceContent('inline int f() { return a; }\nint y;\n')
+        new = zen.SourceContent('inline int f() { return b; }\nint y;\n')
+        self.assertIsNone(new.tree.changed_constructs(old.tree))
+
+    def test_tree_finds_change_to_exposed_content(self):
+        old = zen.SourceContent('int f() { return 1; }\nint y;\n')
+        new = zen.SourceContent('int f() { return 1; }\nint y = 2;\n')
+        self.assertIsNone(new.tree.changed_constructs(old.tree))
+
+
+class TestConstruct(TestCase):
+    def test_merge_creates_construct_with_content_of_both(self):
+        a = zen.Construct('Foo', ['a'])
+        b = zen.Construct('Foo', ['b', 'c'])
+        merged = a.merge(b)
+        self.assertEqual(('a', 'b', 'c'), merged.content)
+        self.assertEqual(('a',), a.content)
+        self.assertEqual('Foo', merged.name)
+
 
 class TestSourcePos(TestCase):
     def test_position_can_be_added_to(self):
@@ -668,6 +1065,14 @@ class TestSourcePos(TestCase):
         self.assertEqual('h', chunk[b])
         self.assertEqual('l', chunk[c])
 
+    def test_position_created_from_offset_has_correct_indices(self):
+        content = zen.SourceContent('This file\nhas three\nlines.')
+        a = zen.SourcePos.from_offset(content, 12, zen.SourceForm.STRIPPED)
+        self.assertEqual(1, a.line_i)
+        self.assertEqual(2, a.col_i)
+        self.assertEqual(
+            zen.SourcePos(content, 1, 2, zen.SourceForm.STRIPPED), a)
+
     def test_positions_with_same_indices_are_equal(self):
         content = zen.SourceContent('This file\nhas three\nlines.')
         a = zen.SourcePos(content, 0, 4, zen.SourceForm.STRIPPED)
@@ -785,6 +1190,16 @@ class TestChunk(TestCase):
             chunk.tokenize()
         )
 
+    def test_tokens_are_cut_at_chunk_bounds(self):
+        content = zen.SourceContent('int foo123 = bar;')
+        chunk = zen.Chunk(content)[6:15]
+        self.assertEqual(['o123', 'ba'], chunk.tokenize())
+
+    def test_equal_tokens_are_interned(self):
+        content = zen.SourceContent('int foo = 1;\nint bar = foo;')
+        tokens = zen.Chunk(content).tokenize()
+        self.assertIs(tokens[1], tokens[5])
+
     def test_simple_bracket_pair_can_be_found(self):
         content = zen.SourceContent('Some bracket {\nfoo;\n}\n')
         chunk = zen.Chunk(content)
@@ -817,6 +1232,16 @@ class TestChunk(TestCase):
         self.assertEqual(2, end_pos.line_i)
         self.assertEqual(0, end_pos.col_i)
 
+    def test_bracket_pairs_are_tabulated(self):
+        content = zen.SourceContent('f(a[0], "(") {\n#define X {\n}\n')
+        self.assertEqual({1: 11, 3: 5, 13: 27}, content.bracket_pairs())
+
+    def test_bracket_pair_outside_chunk_raises_parsing_exception(self):
+        content = zen.SourceContent('{foo {\n{foo};\n}\n}')
+        chunk = zen.Chunk(content)[:10]
+        self.assertRaises(
+            zen.ParsingException, chunk.find_pair, chunk.pos(0, 0))
+
     def test_quote_end_can_be_found(self):
         content = zen.SourceContent('foo("some [string]\\" argument")')
         chunk = zen.Chunk(content)
@@ -825,6 +1250,13 @@ class TestChunk(TestCase):
         self.assertEqual(0, end_pos.line_i)
         self.assertEqual(29, end_pos.col_i)
 
+    def test_raw_string_quote_end_can_be_found(self):
+        content = zen.SourceContent('s = R"x({\n"a": ")"\n})x";\n')
+        chunk = zen.Chunk(content)
+        end_pos = chunk.find_quote_end(chunk.pos(0, 5))
+        self.assertEqual(2, end_pos.line_i)
+        self.assertEqual(3, end_pos.col_i)
+
     def test_line_can_be_retrieved_from_pos(self):
         content = zen.SourceContent('{Some bracket {\n{foo};\n}\n}')
         chunk = zen.Chunk(content)
@@ -1181,13 +1613,438 @@ class TestFindScopeTokens(TestCase):
         self.assertEqual(['template', 'T', 'custom_max'], tokens)
 
 
+class TestLex(TestCase):
+    def test_tokens_have_correct_types(self):
+        tokens = zen.lex('std::string s = u8"a;b";\n')
+        self.assertEqual(
+            [zen.TokenType.IDENTIFIER, zen.TokenType.PUNCTUATION,
+             zen.TokenType.IDENTIFIER, zen.TokenType.IDENTIFIER,
+             zen.TokenType.PUNCTUATION, zen.TokenType.LITERAL,
+             zen.TokenType.PUNCTUATION],
+            [token.type for token in tokens]
+        )
+        self.assertEqual('u8"a;b"', tokens[5].s)
+
+    def test_token_offsets_are_correct(self):
+        tokens = zen.lex('int  foo(x);')
+        self.assertEqual((5, 8), (tokens[1].start, tokens[1].end))
+
+    def test_preprocessor_directive_is_single_token(self):
+        tokens = zen.lex('#define FOO(a) \\\na\nint b;')
+        self.assertEqual(zen.TokenType.PREPROCESSOR, tokens[0].type)
+        self.assertEqual('#define FOO(a) \\\na', tokens[0].s)
+        self.assertEqual('int', tokens[1].s)
+
+    def test_shift_and_operator_names_are_not_brackets(self):
+        tokens = zen.lex('a<<operator<(b)->c<d>')
+        self.assertEqual(
+            ['a', '<<', 'operator<', '(', 'b', ')', '->', 'c', '<', 'd', '>'],
+            [token.s for token in tokens]
+        )
+        self.assertEqual(
+            {12: 14, 18: 20},
+            zen.SourceContent('a<<operator<(b)->c<d>').bracket_pairs()
+        )
+
+    def test_greater_equal_and_right_shifts_are_not_brackets(self):
+        tokens = zen.lex('a<b; c>=d; e>>=f; g<h>')
+        self.assertEqual(
+            ['a', '<', 'b', ';', 'c', '>=', 'd', ';', 'e', '>>=', 'f', ';',
+             'g', '<', 'h', '>'],
+            [token.s for token in tokens]
+        )
+        self.assertEqual(
+            {19: 21},
+            zen.SourceContent('a<b; c>=d; e>>=f; g<h>').bracket_pairs()
+        )
+        self.assertEqual(
+            {1: 11}, zen.SourceContent('f(a<b, c>>d);').bracket_pairs())
+
+    def test_right_shift_closes_nested_template_arguments(self):
+        content = zen.SourceContent('std::vector<std::vector<int>> v;')
+        self.assertEqual({11: 28, 23: 27}, content.bracket_pairs())
+
+
 class TestIterHash(TestCase):
     def test_hash_is_repeatable(self):
-        result: int = zen.iter_hash((s for s in ['a', 'b', 'c']))
-        if sys.maxsize == 2 ** 63 - 1:
-            self.assertEqual(8304879420899386742, result)
-        else:
-            self.assertEqual(2082300178, result)
+        result: bytes = zen.iter_hash((s for s in ['a', 'b', 'c']))
+        self.assertEqual(
+            bytes.fromhex('b80d61302ef97f2fece16a9b51a194db'), result)
+
+    def test_hash_is_fixed_width(self):
+        self.assertEqual(zen.HASH_SIZE, len(zen.iter_hash([])))
+        self.assertEqual(zen.HASH_SIZE, len(zen.join_hashes(
+            [zen.iter_hash(['a']), zen.iter_hash(['b'])])))
+
+    def test_chunk_is_hashed_as_its_str(self):
+        for text in ('int a;\nint b;', 'auto s = "\u00e9";'):
+            chunk = zen.Chunk(zen.SourceContent(text))[4:]
+            self.assertEqual(
+                zen.iter_hash([str(chunk)]), zen.iter_hash([chunk]))
+
+    def test_hash_depends_on_separation_of_strings(self):
+        self.assertNotEqual(
+            zen.iter_hash(['ab', 'c']), zen.iter_hash(['a', 'bc']))
+
+
+class TestParseCache(TestCase):
+    def test_components_are_restored_from_cache(self):
+        with ALTERNATE_SAMPLE_H_PATH.open() as src_f:
+            s = src_f.read()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = zen.ParseCache(Path(temp_dir))
+            parsed = zen.SourceContent(s, cache).component
+            restored = cache.load(zen.SourceContent(s))
+            self.assertIsNotNone(restored)
+            # noinspection PyUnresolvedReferences
+            parsed_class = parsed.sub_components[1].sub_components[0]
+            # noinspection PyUnresolvedReferences
+            restored_class = restored.sub_components[1].sub_components[0]
+            self.assertIsInstance(restored_class, zen.CppClassDefinition)
+            self.assertEqual(parsed_class.name, restored_class.name)
+            self.assertEqual(
+                str(parsed_class.prefix), str(restored_class.prefix))
+            self.assertEqual(
+                parsed_class.construct_content.keys(),
+                restored_class.construct_content.keys()
+            )
+
+    def test_changed_content_is_not_restored(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = zen.ParseCache(Path(temp_dir))
+            zen.SourceContent('int foo();', cache).component
+            self.assertIsNone(cache.load(zen.SourceContent('int bar();')))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = zen.ParseCache(Path(temp_dir))
+            old = zen.SourceContent('int foo();')
+            new = zen.SourceContent('int bar();')
+            cache.store(old, old.component)
+            cache.store(new, new.component)
+            os.utime(str(Path(temp_dir, f'{old.digest}.json')), (0, 0))
+            cache.max_size = os.path.getsize(
+                str(Path(temp_dir, f'{new.digest}.json')))
+            cache.evict()
+            self.assertIsNone(cache.load(zen.SourceContent('int foo();')))
+            self.assertIsNotNone(cache.load(zen.SourceContent('int bar();')))
+
+
+class TestStatCache(TestCase):
+    def tearDown(self):
+        zen.clear()
+
+    def test_stat_is_cached_until_invalidated(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir, 'a.h')
+            path.write_text('int a;')
+            os.utime(str(path), ns=(1000, 1000))
+            cache = zen.StatCache()
+            self.assertEqual(1000, cache.stat(path).m_time)
+            os.utime(str(path), ns=(2000, 2000))
+            self.assertEqual(1000, cache.stat(path).m_time)
+            cache.invalidate(path)
+            self.assertEqual(2000, cache.stat(path).m_time)
+
+    def test_prefetch_caches_present_and_missing_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir, 'a.h')
+            path.write_text('int a;')
+            missing_path = Path(temp_dir, 'b.h')
+            cache = zen.StatCache()
+            cache.prefetch([path, missing_path])
+            path.unlink()
+            missing_path.write_text('int b;')
+            self.assertEqual(6, cache.stat(path).size)
+            with self.assertRaises(FileNotFoundError):
+                cache.stat(missing_path)
+
+    def test_prefetch_is_not_stopped_by_broken_symlink(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            link_path = Path(temp_dir, 'a.h')
+            link_path.symlink_to(Path(temp_dir, 'missing.h'))
+            paths = [Path(temp_dir, f'{name}.h') for name in 'bcd']
+            for path in paths:
+                path.write_text('int a;')
+            cache = zen.StatCache()
+            cache.prefetch([link_path] + paths)
+            for path in paths:
+                path.unlink()
+                self.assertEqual(6, cache.stat(path).size)
+            with self.assertRaises(FileNotFoundError):
+                cache.stat(link_path)
+
+    def test_source_content_is_reloaded_when_stat_changes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir, 'a.h')
+            path.write_text('int a;')
+            source = zen.SourceFile(path)
+            source.stat_cache = zen.StatCache()
+            self.assertEqual('int a;', source.content.text(zen.SourceForm.RAW))
+            path.write_text('int bc;')
+            self.assertEqual('int a;', source.content.text(zen.SourceForm.RAW))
+            source.stat_cache.invalidate(path)
+            self.assertEqual(
+                'int bc;', source.content.text(zen.SourceForm.RAW))
+
+
+class TestHashStore(TestCase):
+    @staticmethod
+    def hash_of(i: int) -> bytes:
+        return zen.iter_hash([str(i)])
+
+    def test_committed_values_are_looked_up_by_new_store(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = zen.SqliteHashStore(Path(temp_dir))
+            store.hashes['a'] = self.hash_of(1)
+            store.stamps['a'] = [1, 2, 3]
+            store.stamps['b'] = 4
+            store.commit()
+            store.hashes['b'] = self.hash_of(5)  # Not committed.
+            store.close()
+            store = zen.SqliteHashStore(Path(temp_dir))
+            self.assertEqual(self.hash_of(1), store.hashes['a'])
+            self.assertEqual([1, 2, 3], store.stamps['a'])
+            self.assertNotIn('b', store.hashes)
+            store.close()
+
+    def test_stale_keys_are_collected(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for store in (zen.SqliteHashStore(Path(temp_dir)),
+                          zen.JsonHashStore(Path(temp_dir))):
+                store.hashes['a'] = self.hash_of(1)
+                store.hashes['b'] = self.hash_of(2)
+                store.stamps['b'] = 3
+                store.commit()
+                store.hashes['c'] = self.hash_of(4)
+                store.commit({'a', 'c'})
+                self.assertEqual(
+                    {'a': self.hash_of(1), 'c': self.hash_of(4)},
+                    dict(store.items('hashes')))
+                self.assertEqual({}, dict(store.items('stamps')))
+                store.close()
+
+    def test_json_store_is_imported_into_new_database(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_store = zen.JsonHashStore(Path(temp_dir))
+            json_store.hashes['a'] = self.hash_of(1)
+            json_store.stamps['a'] = [1, 2, 3]
+            json_store.commit()
+            store = zen.SqliteHashStore(Path(temp_dir))
+            self.assertEqual(self.hash_of(1), store.hashes['a'])
+            self.assertEqual([1, 2, 3], store.stamps['a'])
+            store.close()
+
+    def test_database_with_other_schema_version_is_recreated(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = zen.SqliteHashStore(Path(temp_dir))
+            store.hashes['a'] = self.hash_of(1)
+            store.commit()
+            store.connection.execute('PRAGMA user_version = 1000')
+            store.close()
+            store = zen.SqliteHashStore(Path(temp_dir))
+            self.assertNotIn('a', store.hashes)
+            store.close()
+
+    def test_values_are_looked_up_again_after_change_by_other_store(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = zen.SqliteHashStore(Path(temp_dir))
+            other = zen.SqliteHashStore(Path(temp_dir))
+            self.assertNotIn('a', store.hashes)
+            other.hashes['a'] = self.hash_of(1)
+            other.commit()
+            store.reload()
+            self.assertEqual(self.hash_of(1), store.hashes['a'])
+            store.close()
+            other.close()
+
+    def test_trees_are_restored_by_each_backend(self):
+        tree = zen.SourceTree(
+            self.hash_of(1), self.hash_of(2), {'f': self.hash_of(3)})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for store_type in (zen.SqliteHashStore, zen.JsonHashStore):
+                store = store_type(Path(temp_dir))
+                store.trees['a'] = tree
+                store.commit()
+                store.close()
+                store = store_type(Path(temp_dir))
+                self.assertEqual(tree, store.trees['a'])
+                store.close()
+
+    def test_json_store_of_other_version_is_discarded(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = zen.JsonHashStore(Path(temp_dir))
+            store.path.write_text(json.dumps({'a': 1}))
+            self.assertNotIn('a', store.hashes)
+
+
+class TestDaemon(TestCase):
+    def tearDown(self):
+        zen.clear()
+
+    def test_daemon_handles_requests_until_stopped(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            daemon = zen.Daemon(build_path)
+            thread = threading.Thread(target=daemon.serve)
+            thread.start()
+            try:
+                while not zen.Daemon.socket_path(build_path).exists():
+                    time.sleep(0.01)
+                self.assertEqual(
+                    {'ok': True}, zen.Daemon.request(build_path, 'meditate'))
+                build_dir = daemon.build_dir
+                self.assertEqual(
+                    {'ok': True}, zen.Daemon.request(build_path, 'remember'))
+                self.assertIs(build_dir, daemon.build_dir)
+                self.assertTrue(build_dir.cache_path.exists())
+                self.assertFalse(
+                    zen.Daemon.request(build_path, 'fly')['ok'])
+            finally:
+                zen.Daemon.request(build_path, 'stop')
+                thread.join()
+            self.assertFalse(zen.Daemon.socket_path(build_path).exists())
+            self.assertIsNone(zen.Daemon.request(build_path, 'ping'))
+
+    def test_socket_path_is_short_for_deep_build_dir(self):
+        deep_path = Path('/', *['deep_build_dir'] * 20)
+        self.assertLess(len(str(zen.Daemon.socket_path(deep_path))), 100)
+        self.assertIsNone(zen.Daemon.request(deep_path, 'ping'))
+
+    def test_socket_in_shared_dir_is_not_trusted(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            build_path = Path(temp_dir, 'build')
+            environ = dict(os.environ, XDG_RUNTIME_DIR=temp_dir)
+            with mock.patch.dict(os.environ, environ):
+                path = zen.Daemon.socket_path(build_path)
+                path.parent.mkdir(mode=0o755)
+                path.parent.chmod(0o755)
+                with socket.socket(socket.AF_UNIX) as server:
+                    server.bind(str(path))
+                    server.listen()
+                    self.assertIsNone(zen.Daemon.request(build_path, 'ping'))
+                with self.assertRaises(ValueError):
+                    zen.Daemon(build_path).serve()
+
+    def test_build_dir_args_of_client_are_used(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            daemon = zen.Daemon(Path(project_dir, 'build'))
+            build_dir = daemon.current_build_dir()
+            daemon.configure({'precise_m_time': True, 'jobs': 2,
+                              'cache_backend': 'sqlite'})
+            self.assertIs(build_dir, daemon.current_build_dir())
+            self.assertEqual(2, build_dir.jobs)
+            self.assertTrue(build_dir.precise_m_time)
+            daemon.configure({'cache_backend': 'json'})
+            self.assertIsInstance(
+                daemon.current_build_dir().store, zen.JsonHashStore)
+
+    def test_build_dir_is_reloaded_when_layout_changes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            daemon = zen.Daemon(Path(project_dir, 'build'))
+            build_dir = daemon.current_build_dir()
+            self.assertIs(build_dir, daemon.current_build_dir())
+            depend_path = Path(
+                build_dir.targets['hello'].path, 'depend.internal')
+            depend_path.write_text(depend_path.read_text() + '\n')
+            self.assertIsNot(build_dir, daemon.current_build_dir())
+
+    def test_prehash_finds_objects_with_changed_used_content(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            daemon = zen.Daemon(Path(project_dir, 'build'))
+            daemon.current_build_dir().remember()
+            header_path = Path(project_dir, 'sample.h')
+            original = header_path.read_text()
+            shutil.copy(str(CHANGED_SAMPLE_H_PATH), str(header_path))
+            daemon.prehash([header_path])
+            self.assertEqual(
+                {'main.cc.o': True, 'sample.cc.o': True},
+                {obj.path.name: changed for obj, changed
+                 in daemon.ready_decisions().items()}
+            )
+            header_path.write_text(original + '\n// Comment.\n')
+            daemon.prehash([header_path])
+            self.assertEqual(
+                {'main.cc.o': False, 'sample.cc.o': False},
+                {obj.path.name: changed for obj, changed
+                 in daemon.ready_decisions().items()}
+            )
+            daemon.run_task('remember')
+            self.assertEqual({}, daemon.ready_decisions())
+
+    def test_meditation_applies_ready_decisions(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            daemon = zen.Daemon(Path(project_dir, 'build'))
+            daemon.current_build_dir().remember()
+            header_path = Path(project_dir, 'sample.h')
+            header_path.write_text(
+                header_path.read_text() + '\n// Comment.\n')
+            daemon.prehash([header_path])
+            obj, = [obj for obj in daemon.ready_decisions()
+                    if obj.path.name == 'main.cc.o']
+            daemon.decisions[obj] = daemon.decisions[obj][0], True
+            daemon.run_task('meditate')
+            self.assertEqual(zen.Status.CHANGED, obj.status)
+
+
+class TestMake(TestCase):
+    def tearDown(self):
+        zen.clear()
+
+    def test_build_dir_is_remembered_after_successful_build(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            Path(build_path, 'test.mk').write_text('all:\n\ttrue\n')
+            daemon = zen.Daemon(build_path)
+            result = zen.make(daemon, ['-s', '-f', 'test.mk'], False)
+            self.assertEqual(0, result)
+            self.assertTrue(
+                Path(build_path, zen.SqliteHashStore.FILE_NAME).exists())
+
+    def test_build_dir_is_not_remembered_after_failed_build(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            project_dir = copy_sample_project(temp_dir)
+            build_path = Path(project_dir, 'build')
+            Path(build_path, 'test.mk').write_text('all:\n\tfalse\n')
+            daemon = zen.Daemon(build_path)
+            result = zen.make(daemon, ['-s', '-f', 'test.mk'], False)
+            self.assertNotEqual(0, result)
+            self.assertFalse(
+                Path(build_path, zen.SqliteHashStore.FILE_NAME).exists())
+
+    def test_only_make_passes_trailing_args_on(self):
+        args = zen.parse_args(['meditate', 'build', '--verbose', '-j', '2'])
+        self.assertTrue(args.verbose)
+        self.assertEqual(2, args.jobs)
+        args = zen.parse_args(['-v', 'make', 'build', '-j4', '--verbose'])
+        self.assertTrue(args.verbose)
+        self.assertEqual(1, args.jobs)
+        self.assertEqual(['-j4', '--verbose'], args.make_args)
+        with self.assertRaises(SystemExit):
+            zen.parse_args(['remember', 'build', 'all'])
+
+
+class TestInotify(TestCase):
+    def test_saved_files_are_reported(self):
+        try:
+            inotify = zen.Inotify()
+        except OSError:
+            self.skipTest('inotify is not available.')
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                wd = inotify.add_watch(temp_dir, zen.Inotify.FILE_CHANGES)
+                Path(temp_dir, 'a.h').write_text('int a;')
+                names = {name for event_wd, _, name in inotify.read_events()
+                         if event_wd == wd}
+                self.assertEqual({'a.h'}, names)
+        finally:
+            inotify.close()
 
 class TestParseTags(TestCase):
     def test_parse_tags(self):
@@ -22,19 +22,35 @@
 """
 
 import argparse
+from array import array
+import bisect
+import ctypes
+import ctypes.util
 import enum
 import hashlib
 import itertools
 import json
+import mmap
+import multiprocessing
 import os
 from pathlib import Path
 import re
+import select
+import socket
+from stat import S_ISDIR
 import string
+import struct
 import subprocess as sub
 import sys
+import tempfile
 import time
 import typing as ty
 
+try:
+    import sqlite3
+except ImportError:  # Python may be built without SQLite.
+    sqlite3 = None
+
 
 class ParsingException(Exception):
     """
@@ -70,6 +86,9 @@ LIB_TYPES = {TargetType.STATIC_LIB, TargetType.SHARED_LIB}
 
 HEADER_EXT = '.h', '.hpp', '.hh', '.hxx'
 
+HASH_SIZE = 16  # bytes of each content hash.
+DIGEST_BLOCK_SIZE = 1024 * 1024  # bytes read at once for raw digests.
+
 BRACKETS = {
     '(': ')',
     '{': '}',
@@ -77,6 +96,53 @@ BRACKETS = {
     '<': '>'
 }
 
+# Pattern matching a string or char literal, including raw strings
+# such as R"delim(...)delim" and encoding prefixes such as u8 or L.
+LITERAL_REGEX = r'''
+    (?:u8|[uUL])?(?:
+        R"(?P<delimiter>[^()\\\s"]{0,16})\([\s\S]*?\)(?P=delimiter)"
+      | "(?:[^"\\\n]|\\[\s\S])*"
+      | '(?:[^'\\\n]|\\[\s\S])*')
+'''
+
+# Pattern matching a number, including digit separators, so that
+# they are not mistaken for the start of a char literal.
+NUMBER_REGEX = r'''\.?\d(?:[eEpP][+-]|'(?=\w)|[\w.])*'''
+
+# Pattern used to find comments in source text. Literals are matched
+# so that comment markers within them are ignored, and identifiers so
+# that literal prefixes are only recognized at the start of a word.
+LITERAL_SCAN_PATTERN = re.compile(r'''
+    (?P<comment>//(?:[^\n\\]|\\[\s\S])*|/\*[\s\S]*?(?:\*/|\Z))
+  | (?P<literal>''' + LITERAL_REGEX + r''')
+  | ''' + NUMBER_REGEX + r'''
+  | \w+
+''', re.VERBOSE)
+
+NEWLINE_PATTERN = re.compile('\n')
+
+# Pattern matching the words that components are tokenized into.
+WORD_REGEX = r'[\w0-9]+'
+WORD_PATTERN = re.compile(WORD_REGEX)
+
+# Pattern used to split source text into tokens. Alternatives are tried
+# in order, so literals are matched before identifiers (to capture
+# prefixes such as u8 or L) and numbers before identifiers.
+# Preprocessor directives must begin at the start of a line, as they do
+# in the STRIPPED source form. Operator function names, and operators
+# which begin with '<' or '>' but never enclose template arguments,
+# are matched as a whole so their chars are not paired as angle
+# brackets. '>>' is matched as a whole as well, and is only paired
+# where it may close two template argument lists.
+TOKEN_PATTERN = re.compile(r'''
+    (?P<preprocessor>(?<![^\n])\#(?:[^\n]*\\\n)*[^\n]*)
+  | (?P<literal>''' + LITERAL_REGEX + r''')
+  | (?P<number>''' + NUMBER_REGEX + r''')
+  | (?P<identifier>operator\s*(?:<=>|<<=?|>>=?|<=?|>=?|->\*?)|\w+)
+  | (?P<bracket>[()\[\]{}]|<(?![<=])|>(?![>=]))
+  | (?P<punctuation>::|<=>|<<=?|<=|>>=?|>=|->\*?|[^\s\w])
+''', re.VERBOSE)
+
 
 #######################################################################
 # Build constructs
@@ -87,39 +153,294 @@ class BuildDir:
     Root build data class.
     """
 
-    CACHE_NAME = 'zen_cache'
-
-    def __init__(self, path: str) -> None:
+    def __init__(
+            self,
+            path: str,
+            precise_m_time: bool = False,
+            jobs: int = 1,
+            cache_backend: str = 'sqlite'
+    ) -> None:
+        """
+        Initializes a new build directory handler.
+        :param path: path to build directory.
+        :param precise_m_time: If True, the modification time of each
+                    file whose build is avoided is set to just after
+                    that of its newest dependency, rather than to the
+                    current time.
+        :param jobs: Number of processes used to parse and hash sources.
+        :param cache_backend: Backend of the store of remembered
+                    hashes; 'sqlite' or 'json'.
+        """
         self.path = Path(path)
+        self.precise_m_time = precise_m_time
+        self.jobs = jobs
         self.targets = self._find_targets()
+        # Keyed by resolved path, as dependency paths are resolved.
         self.targets_by_path = {
-            target.file_path.absolute(): target
+            target.file_path.resolve(): target
             for target in self.targets.values()
         }
-        self.sources = self._find_sources()
-        self._hash_cache: ty.Dict[str, int] = None
+        self.dependents = self._find_dependents()
+        self.sources: ty.Set['SourceFile'] = set(self.dependents)
+        self.sources_by_path: ty.Dict[Path, 'SourceFile'] = {
+            source.path: source for source in self.sources}
+        self.store = open_hash_store(self.path, cache_backend)
+        self.parse_cache = ParseCache(Path(self.path, ParseCache.DIR_NAME))
+        self.stat_cache = StatCache()
+        self._avoided: ty.Dict[str, ty.Optional[int]] = {}
+        for source in self.sources:
+            source.parse_cache = self.parse_cache
+            source.stat_cache = self.stat_cache
 
-    def meditate(self) -> None:
+    def meditate(
+            self,
+            decisions: ty.Optional[ty.Dict['CompileObject', bool]] = None
+    ) -> None:
         """
         Minimizes number of objects and targets that need to
         be rebuilt.
+        :param decisions: whether each object must be rebuilt, for
+                    objects for which this has already been decided.
         :return: None
         """
-        [target.meditate() for target in self.targets.values()]
+        try:
+            modified = self.modified_objects()
+            verbose(f'{len(modified)} objects have modified sources.')
+            scheduler = Scheduler(self)
+            scheduler.run(modified, decisions)
+            verbose(f'Critical path: {scheduler.critical_path()}')
+        finally:
+            # Objects already found to need no rebuild are updated even
+            # if meditation of others fails.
+            self.update_avoided_m_times()
+        self.parse_cache.evict()
 
     def remember(self) -> None:
         """
         Stores information about the current form of the source code,
         so that it may later be determined later what has been changed
         substantially enough to require recompilation.
+
+        Only sources whose stat has changed since they were last
+        remembered, and objects which have since been modified or which
+        have a changed source, are hashed again. Everything else is
+        carried forward from the cache.
+        :return: None
+        """
+        hash_cache = self.hash_cache
+        stamps = self.stamp_cache
+        changed_sources = {
+            source for source in self.sources
+            if source.hex not in hash_cache or
+            stamps.get(source.hex) != list(source.stat)
+        }
+        changed_objects = [
+            obj for target in self.targets.values()
+            for obj in target.objects
+            if self._object_changed(obj, changed_sources)
+        ]
+        verbose(f'Remembering {len(changed_sources)} sources and '
+                f'{len(changed_objects)} objects.')
+        if not changed_sources and not changed_objects:
+            self.parse_cache.evict()
+            return
+        if self.jobs > 1:
+            self.hash_objects(changed_objects)
+        # Objects are remembered first, as whether an object's
+        # remembered hash is still current is found from the
+        # remembered hashes and trees of its sources.
+        for obj in changed_objects:
+            obj.remember()
+            try:
+                stamps[obj.hex] = obj.m_time
+            except FileNotFoundError:
+                stamps.pop(obj.hex, None)
+        for source in changed_sources:
+            source.remember(self.store)
+            stamps[source.hex] = list(source.stat)
+        self.store.commit(
+            {source.hex for source in self.sources} |
+            {obj.hex for target in self.targets.values()
+             for obj in target.objects}
+        )
+        self.parse_cache.evict()
+
+    def export(self, backend: str = 'json') -> None:
+        """
+        Copies remembered hashes and stamps from the store of the build
+        dir into a store of another backend, in the same directory.
+        :param backend: backend of the store to export to.
+        :return: None
+        """
+        exported = open_hash_store(self.path, backend)
+        if type(exported) is type(self.store):
+            return
+        try:
+            exported.copy_from(self.store)
+        finally:
+            exported.close()
+
+    def _object_changed(
+            self,
+            obj: 'CompileObject',
+            changed_sources: ty.Set['SourceFile']
+    ) -> bool:
+        """
+        Checks whether an object must be hashed again when remembering.
+
+        :param obj: CompileObject.
+        :param changed_sources: sources whose stat has changed since
+                    they were last remembered.
+        :return: True if the object is not in the cache, if it has been
+                    modified since it was last remembered, or if any of
+                    its sources have changed.
+        """
+        if obj.hex not in self.hash_cache:
+            return True
+        try:
+            m_time = obj.m_time
+        except FileNotFoundError:
+            return True
+        if self.stamp_cache.get(obj.hex) != m_time:
+            return True
+        return any(source in changed_sources for source in obj.sources)
+
+    def reset(self) -> None:
+        """
+        Prepares the build dir to be meditated upon or remembered
+        again, discarding the statuses and file stats found by
+        previous runs.
+
+        Values looked up from the hash store are discarded only if the
+        store has been changed by another process, and source content
+        and hashes are kept until the stat of the files they were found
+        from changes.
         :return: None
         """
-        for dep in self.sources:
-            dep.remember(self.hash_cache)
+        self.stat_cache.invalidate()
+        self._avoided.clear()
+        self.store.reload()
         for target in self.targets.values():
-            target.remember()
-        with self.cache_path.open('w') as f:
-            json.dump(self.hash_cache, f)
+            target.reset()
+
+    def hash_objects(self, objects: ty.Iterable['CompileObject']) -> None:
+        """
+        Computes the used content hash of each passed object, and the
+        stripped hash of each of their sources, in a pool of
+        worker processes.
+        :param objects: CompileObjects to hash.
+        :return: None
+        """
+        for _ in self.iter_hashed_objects(objects):
+            pass
+
+    def iter_hashed_objects(
+            self,
+            objects: ty.Iterable['CompileObject']
+    ) -> ty.Iterator['CompileObject']:
+        """
+        Hashes the passed objects in a pool of worker processes,
+        yielding each object as soon as its hashes are available.
+
+        Workers return only hashes and trees, which are stored on the
+        objects and sources, so that their content does not need to be parsed
+        again in this process. Objects whose hashes are already known
+        are yielded first, without being hashed again.
+
+        :param objects: CompileObjects to hash.
+        :return: Iterator of CompileObjects, in the order in which
+                    they were hashed.
+        """
+        unhashed = []
+        for obj in objects:
+            if obj.hashed:
+                yield obj
+            else:
+                unhashed.append(obj)
+        objects = unhashed
+        if not objects:
+            return
+        jobs = [(i, [str(source.path) for source in obj.sources])
+                for i, obj in enumerate(objects)]
+        with multiprocessing.Pool(
+                self.jobs,
+                initializer=_init_hash_worker,
+                initargs=(str(self.parse_cache.path), verbose_opt)
+        ) as pool:
+            results = pool.imap_unordered(_hash_object, jobs)
+            for i, used_content_hash, used_names, stripped_hashes, trees \
+                    in results:
+                obj = objects[i]
+                obj.set_used_content_hash(used_content_hash, used_names)
+                for source, stripped_hash, tree in zip(
+                        obj.sources, stripped_hashes, trees):
+                    source.set_stripped_hash(stripped_hash)
+                    if source.is_header:
+                        source.set_tree(tree)
+                yield obj
+
+    def avoid_build(
+            self,
+            path: Path,
+            dependencies: ty.Iterable[Path] = ()
+    ) -> None:
+        """
+        Queues the file at the passed path to be marked as up to date,
+        once meditation has finished.
+
+        :param path: path to object or target file.
+        :param dependencies: paths of the files the passed file is
+                    built from. Only used if precise_m_time is set.
+        :return: None
+        """
+        newest: ty.Optional[int] = None
+        if self.precise_m_time:
+            for dependency in dependencies:
+                try:
+                    m_time = self.expected_m_time(dependency)
+                except FileNotFoundError:
+                    continue
+                if newest is None or m_time > newest:
+                    newest = m_time
+        self._avoided[os.path.abspath(str(path))] = newest
+
+    def expected_m_time(self, path: Path) -> int:
+        """
+        Gets the modification time that the file at the passed path
+        will have once queued updates have been made.
+
+        :param path: path to file.
+        :return: int time in nanoseconds since epoch.
+        :raises FileNotFoundError if file does not exist.
+        """
+        try:
+            newest_dependency = self._avoided[os.path.abspath(str(path))]
+        except KeyError:
+            pass
+        else:
+            if newest_dependency is not None:
+                return newest_dependency + 1
+        return self.stat_cache.stat(path).m_time
+
+    def update_avoided_m_times(self) -> None:
+        """
+        Updates the modification times of all files queued by
+        avoid_build, in the order they were queued.
+
+        Files which do not exist are not created.
+        :return: None
+        """
+        for path, newest_dependency in self._avoided.items():
+            try:
+                if newest_dependency is None:
+                    os.utime(path)
+                else:
+                    m_time = newest_dependency + 1
+                    os.utime(path, ns=(m_time, m_time))
+            except FileNotFoundError:
+                pass
+            self.stat_cache.invalidate(path)
+        self._avoided.clear()
 
     def _find_targets(self) -> ty.Dict[str, 'Target']:
         """
@@ -134,36 +455,218 @@ class BuildDir:
             targets[name] = Target(name, target_dir, self)
         return targets
 
-    def _find_sources(self) -> ty.Set['SourceFile']:
-        dependencies = set()
+    def _find_dependents(
+            self
+    ) -> ty.Dict['SourceFile', ty.List['CompileObject']]:
+        """
+        Builds index of the objects that depend on each source file.
+        :return: dict of CompileObject lists by SourceFile.
+        :rtype: Dict[SourceFile, List[CompileObject]]
+        """
+        dependents: ty.Dict['SourceFile', ty.List['CompileObject']] = {}
         for target in self.targets.values():
             for compile_object in target.objects:
-                for dependency in compile_object.sources:
-                    dependencies.add(dependency)
-        return dependencies
+                for source in compile_object.sources:
+                    try:
+                        dependents[source].append(compile_object)
+                    except KeyError:
+                        dependents[source] = [compile_object]
+        return dependents
 
-    @property
-    def hash_cache(self) -> ty.Dict[str, int]:
+    def modified_objects(self) -> ty.Set['CompileObject']:
         """
-        Gets SourceCache storing previously compiled values.
-        :return: Cache dict.
+        Finds objects which have a source that is more recent than the
+        object itself, or which do not exist.
+
+        Each object and source is checked only once. Only sources more
+        recent than the oldest object can have been modified since an
+        object was built, and so only the dependents of those sources
+        are visited.
+
+        :return: Set of CompileObjects.
+        :rtype: Set[CompileObject]
         """
-        if self._hash_cache is None:
+        modified: ty.Set['CompileObject'] = set()
+        m_times: ty.Dict['CompileObject', int] = {}
+        objects = [obj for target in self.targets.values()
+                   for obj in target.objects]
+        self.stat_cache.prefetch(itertools.chain(
+            (obj.path for obj in objects),
+            (source.path for source in self.dependents)
+        ))
+        for obj in objects:
+            try:
+                m_times[obj] = obj.m_time
+            except FileNotFoundError:
+                modified.add(obj)
+        oldest = min(m_times.values(), default=float('inf'))
+        for source, dependents in self.dependents.items():
             try:
-                with self.cache_path.open() as f:
-                    self._hash_cache = json.load(f)
+                source_m_time = source.m_time
             except FileNotFoundError:
-                self._hash_cache = {}
-        return self._hash_cache
+                modified.update(dependents)
+                continue
+            if source_m_time < oldest:
+                continue
+            modified.update(
+                obj for obj in dependents
+                if obj in m_times and m_times[obj] <= source_m_time
+            )
+        return modified
+
+    @property
+    def hash_cache(self) -> 'CacheTable':
+        """
+        Gets hashes of sources and objects as they were when they
+        were last remembered.
+        :return: CacheTable of hashes by source or object hex.
+        """
+        return self.store.hashes
+
+    @property
+    def stamp_cache(self) -> 'CacheTable':
+        """
+        Gets stamps of sources and objects as they were when they
+        were last remembered.
+
+        Sources are stamped with their modification time, size, and
+        inode, and objects with their modification time.
+        :return: CacheTable of stamps by source or object hex.
+        """
+        return self.store.stamps
 
     @property
     def cache_path(self) -> Path:
-        return Path(self.path, self.CACHE_NAME)
+        return self.store.path
 
     def __repr__(self) -> str:
         return f'BuildDir[{self.path}]'
 
 
+# Node of the dependency graph used by Scheduler.
+Node = ty.Union['Target', 'CompileObject']
+
+
+class Scheduler:
+    """
+    Meditates the targets and objects of a BuildDir in
+    dependency order.
+
+    The graph of targets, the libraries they link, and their objects is
+    built once. Each target is resolved as soon as all of its objects
+    and libraries are, rather than after unrelated parts of the graph.
+    If the build dir uses multiple jobs, objects are hashed
+    concurrently by worker processes, and are resolved in the order
+    their hashes become available.
+    """
+    def __init__(self, build_dir: 'BuildDir') -> None:
+        """
+        Builds the dependency graph of a build dir.
+        :param build_dir: BuildDir instance.
+        """
+        self.build_dir = build_dir
+        self.inputs: ty.Dict['Target', ty.List['Node']] = {}
+        self.dependents: ty.Dict['Node', ty.List['Target']] = {}
+        for target in build_dir.targets.values():
+            inputs = self.inputs[target] = \
+                list(target.objects) + list(target.lib_dependencies)
+            for node in inputs:
+                self.dependents.setdefault(node, []).append(target)
+        self.finish_times: ty.Dict['Node', float] = {}
+        self._pending: ty.Dict['Target', int] = {}
+        self._start_time = 0.0
+
+    def run(
+            self,
+            modified: ty.Set['CompileObject'],
+            decisions: ty.Optional[ty.Dict['CompileObject', bool]] = None
+    ) -> None:
+        """
+        Meditates all objects and targets of the build dir.
+
+        :param modified: objects whose sources have been modified.
+        :param decisions: whether each object must be rebuilt, for
+                    objects for which this has already been decided.
+        :return: None
+        :raises ValueError if targets have cyclic dependencies.
+        """
+        self._start_time = time.monotonic()
+        self._pending = {
+            target: len(inputs) for target, inputs in self.inputs.items()}
+        for target, inputs in self.inputs.items():
+            if not inputs:
+                self._resolve_target(target)
+        for target in self.build_dir.targets.values():
+            for obj in target.objects:
+                if obj not in modified:
+                    obj.meditate(sources_modified=False)
+                    self._resolve(obj)
+        decisions = decisions or {}
+        decided = [obj for obj in modified if obj in decisions]
+        for obj in decided:
+            obj.meditate(sources_modified=True, changed=decisions[obj])
+            self._resolve(obj)
+        undecided = modified.difference(decided)
+        if self.build_dir.jobs > 1:
+            hashed = self.build_dir.iter_hashed_objects(undecided)
+        else:
+            hashed = undecided
+        for obj in hashed:
+            obj.meditate(sources_modified=True)
+            self._resolve(obj)
+        unresolved = [target for target, pending in self._pending.items()
+                      if pending]
+        if unresolved:
+            raise ValueError(
+                f'Targets have cyclic dependencies: {unresolved}')
+
+    def critical_path(self) -> ty.List['Node']:
+        """
+        Gets the chain of dependencies which determined when meditation
+        finished.
+
+        The chain ends with the last target to be resolved, and each
+        node in it is preceded by the input of the following target
+        that was resolved last.
+
+        :return: List of objects and targets, from first to last.
+        :rtype: List[Union[CompileObject, Target]]
+        """
+        final_targets = [target for target in self.inputs
+                         if target in self.finish_times and
+                         not self.dependents.get(target)]
+        if not final_targets:
+            return []
+        node = max(final_targets, key=self.finish_times.get)
+        path = [node]
+        while isinstance(node, Target) and self.inputs[node]:
+            node = max(self.inputs[node], key=self.finish_times.get)
+            path.append(node)
+        path.reverse()
+        return path
+
+    def _resolve(self, node: 'Node') -> None:
+        """
+        Records that the status of the passed node is known, and
+        resolves any targets whose inputs are now all known.
+        :param node: CompileObject or Target.
+        :return: None
+        """
+        self.finish_times[node] = time.monotonic() - self._start_time
+        for target in self.dependents.get(node, ()):
+            self._pending[target] -= 1
+            if not self._pending[target]:
+                self._resolve_target(target)
+
+    def _resolve_target(self, target: 'Target') -> None:
+        if target.status == Status.UNCHECKED:
+            target.resolve_status()
+        self._resolve(target)
+
+    def __repr__(self) -> str:
+        return f'Scheduler[{self.build_dir}]'
+
+
 class Target:
     """
     Class handling interaction with build files of a single target.
@@ -184,23 +687,23 @@ class Target:
         self.file_path, self.type = self._identify_target()
         self.dependency_paths: ty.Set[Path] = self._find_dependencies()
         self.status = Status.UNCHECKED
+        self._lib_dependencies: ty.Optional[ty.Set['Target']] = None
 
-    def meditate(self) -> None:
-        if self.status != Status.UNCHECKED:
-            return  # Already meditated.
+    def resolve_status(self) -> None:
+        """
+        Determines status of the target from the status of its objects,
+        libraries, and other dependencies, and avoids re-linking the
+        target if possible.
 
-        # Run on lib dependencies first; the status of the target will
-        # be determined in part by their change status.
+        Objects and libraries must already have been meditated.
+        :return: None
+        """
         if self.lib_dependencies:
-            for lib in self.lib_dependencies:
-                lib.meditate()
             max_lib_status = max(lib.status for lib in self.lib_dependencies)
         else:
             max_lib_status = Status.NO_CHANGE
 
-        # Run on object dependencies.
         if self.objects:
-            [o.meditate() for o in self.objects]
             max_obj_status = max(o.status for o in self.objects)
         else:
             max_obj_status = Status.NO_CHANGE
@@ -220,15 +723,14 @@ class Target:
                 self.type != TargetType.UNKNOWN:
             self.avoid_build()
 
-    def remember(self) -> None:
+    def reset(self) -> None:
         """
-        Stores information about the current form of the target,
-        so that it may later be determined later what has been changed
-        substantially enough to require recompilation.
+        Discards the status of the target and its objects.
         :return: None
         """
+        self.status = Status.UNCHECKED
         for obj in self.objects:
-            obj.remember()
+            obj.reset()
 
     def avoid_build(self) -> None:
         """
@@ -236,7 +738,7 @@ class Target:
         This method should only be called if target is known.
         :return: None
         """
-        sub.run(['touch', '-c', str(self.file_path.absolute())], check=True)
+        self.build_dir.avoid_build(self.file_path, self.dependency_paths)
 
     @staticmethod
     def type_from_path(path: ty.Union[str, Path]) -> TargetType:
@@ -311,23 +813,35 @@ class Target:
         return path, target_type
 
     def _find_dependencies(self) -> ty.Set[Path]:
+        """
+        Finds paths of files that the target file is built from.
+
+        Rules in build.make are named either after the target, or, for
+        libraries, after the target file's path within the build dir.
+        :return: Set[Path]
+        """
         build_make_path = Path(self.path, 'build.make')
         paths = set()
+        prefixes = [f'{self.name}:']
+        if self.file_path is not None:
+            rel_target_path = os.path.relpath(
+                str(self.file_path), str(self.build_dir.path.resolve()))
+            prefixes.append(f'{rel_target_path}:')
         with build_make_path.open() as f:
-            prefix = f'{self.name}:'
             for line in f.readlines():
-                if line.startswith(prefix):
-                    rel_path = line[len(prefix):].strip()
-                    paths.add(Path(self.build_dir.path, rel_path))
+                for prefix in prefixes:
+                    if line.startswith(prefix):
+                        rel_path = line[len(prefix):].strip()
+                        paths.add(Path(self.build_dir.path, rel_path))
         return paths
 
     @property
-    def m_time(self):
+    def m_time(self) -> int:
         """
-        Gets modification time of compiled object.
-        :return: float time in seconds since epoch.
+        Gets modification time of target file.
+        :return: int time in nanoseconds since epoch.
         """
-        return os.path.getmtime(self.file_path)
+        return self.build_dir.stat_cache.stat(self.file_path).m_time
 
     @property
     def other_status(self) -> Status:
@@ -339,7 +853,9 @@ class Target:
         :return: Status.NO_CHANGE or Status.CHANGED
         :rtype Status
         """
-        if any(os.path.getmtime(other) > self.m_time for
+        stat_cache = self.build_dir.stat_cache
+        own_m_time = self.m_time
+        if any(stat_cache.stat(other).m_time > own_m_time for
                other in self.other_dependencies):
             return Status.CHANGED
         return Status.NO_CHANGE
@@ -348,19 +864,25 @@ class Target:
     def lib_dependencies(self) -> ty.Set['Target']:
         """
         Finds library Targets that this Target relies upon.
+
+        Libraries are found on first access, once all targets of the
+        build dir are known.
         :return: Library Targets.
         :rtype Set[Target]
         """
+        if self._lib_dependencies is not None:
+            return self._lib_dependencies
         libraries = set()
         for dep in self.dependency_paths:
             if self.type_from_path(dep.absolute()) not in LIB_TYPES:
                 continue
             try:
-                target = self.build_dir.targets_by_path[dep]
+                target = self.build_dir.targets_by_path[dep.resolve()]
                 libraries.add(target)
             except KeyError as e:
                 raise ValueError(
                     f'Could not find target with path: {dep}') from e
+        self._lib_dependencies = libraries
         return libraries
 
     @property
@@ -405,33 +927,68 @@ class CompileObject:
         self.sources = [SourceFile(src) for src in sources]
         self.build_dir = build_dir
         self.status = Status.UNCHECKED
-        self._used_content_hash: ty.Optional[int] = None
+        self._used_content_hash: ty.Optional[bytes] = None
+        self._used_names: ty.Optional[ty.Dict[str, ty.List[str]]] = None
+        self._hashed_stats: ty.Optional[ty.List['FileStat']] = None
 
-    def meditate(self) -> None:
+    def meditate(
+            self,
+            sources_modified: ty.Optional[bool] = None,
+            changed: ty.Optional[bool] = None
+    ) -> None:
         """
         Determine whether the managed compilation object should be
         rebuilt or whether compilation can be avoided.
+        :param sources_modified: Whether any source is more recent than
+                    the object, if already known.
+        :param changed: Whether the object must be rebuilt if its
+                    sources are modified, if already decided.
         :return: None
         """
-        if self.sources_modified:
+        if self.status != Status.UNCHECKED:
+            return  # Already meditated.
+        if sources_modified is None:
+            sources_modified = self.sources_modified
+        if sources_modified:
             verbose(f'{repr(self)} sources modified. Checking source.')
         else:
             self.status = Status.NO_CHANGE
             return
 
-        if self._has_code_changes() and self._has_used_content_change():
+        if changed is None:
+            changed = self.has_substantive_changes()
+        if changed:
             self.status = Status.CHANGED
         else:
             self.status = Status.MINOR_CHANGE
             self.avoid_build()
 
+    def has_substantive_changes(self) -> bool:
+        """
+        Checks whether the sources of the object have changed in a way
+        that changes the content used by the object, since it was
+        remembered, so that it must be rebuilt.
+        :return: bool
+        """
+        return self._has_code_changes() and self._has_used_content_change()
+
     def remember(self) -> None:
         """
         Remembers used parts of sources, so that differences can be
         found the next time zen is run.
         :return: None
         """
-        self.build_dir.hash_cache[self.hex] = self.used_content_hash
+        store = self.build_dir.store
+        store.hashes[self.hex] = self.used_content_hash
+        store.uses[self.hex] = self.used_names
+
+    def reset(self) -> None:
+        """
+        Discards the status of the object. Its used content hash is
+        kept until the stat of a source changes.
+        :return: None
+        """
+        self.status = Status.UNCHECKED
 
     def _has_code_changes(self) -> bool:
         """
@@ -441,7 +998,7 @@ class CompileObject:
         :rtype: bool
         """
         for source in self.sources:
-            if source.substantive_changes(self.build_dir.hash_cache):
+            if source.substantive_changes(self.build_dir.store):
                 return True
         return False
 
@@ -451,7 +1008,10 @@ class CompileObject:
         :return: True if used content has changed.
         :rtype: bool
         """
-        cached_hash = self.build_dir.hash_cache[self.hex]
+        try:
+            cached_hash = self.build_dir.hash_cache[self.hex]
+        except KeyError:
+            return True
         return self.used_content_hash != cached_hash
 
     def avoid_build(self) -> None:
@@ -459,15 +1019,16 @@ class CompileObject:
         Un-Marks this object for re-compilation.
         :return: None
         """
-        sub.run(['touch', '-c', str(self.path.absolute())], check=True)
+        self.build_dir.avoid_build(
+            self.path, (source.path for source in self.sources))
 
     @property
-    def m_time(self):
+    def m_time(self) -> int:
         """
         Gets modification time of compiled object.
-        :return: float time in seconds since epoch.
+        :return: int time in nanoseconds since epoch.
         """
-        return os.path.getmtime(self.path.absolute())
+        return self.build_dir.stat_cache.stat(self.path).m_time
 
     @property
     def sources_modified(self) -> bool:
@@ -483,9 +1044,24 @@ class CompileObject:
         return any([own_m_time <= dep.m_time for dep in self.sources])
 
     @property
-    def used_content_hash(self) -> int:
-        if self._used_content_hash is None:
+    def used_content_hash(self) -> bytes:
+        """
+        Gets hash of the content of sources that is used by the object.
+
+        The hash is kept until the stat of any source changes. If no
+        construct used by the object has changed since it was
+        remembered, the remembered hash is used.
+        :return: bytes
+        """
+        stats = [source.stat for source in self.sources]
+        if self._used_content_hash is None or stats != self._hashed_stats:
+            remembered = self._remembered_hash()
+            if remembered is not None:
+                self._used_content_hash, self._used_names = remembered
+                self._hashed_stats = stats
+                return self._used_content_hash
             constructs: ty.Dict[str, 'Construct'] = self.create_constructs()
+            visited: ty.Set[str] = set()
 
             def recurse_component(
                     component: 'Component'
@@ -496,6 +1072,10 @@ class CompileObject:
                 components it possesses, sub-components of those
                 sub-components, etc.
 
+                Each construct is visited only once per object,
+                and the content of already visited constructs is
+                not yielded again.
+
                 :param component: Component to recurse over.
                 :return: Component generator
                 """
@@ -504,9 +1084,9 @@ class CompileObject:
                     yield from recurse_component(sub_component)
                 for construct in component.used_constructs(
                         constructs).values():
-                    if construct.used:
+                    if construct.name in visited:
                         continue
-                    construct.used = True
+                    visited.add(construct.name)
                     for component in construct.content:
                         yield from recurse_component(component)
 
@@ -517,41 +1097,121 @@ class CompileObject:
                 for component in block.sub_components:
                     yield from recurse_component(component)
 
-            def used_chunk_strings(source: 'SourceFile') -> ty.Iterable[str]:
+            def used_chunks(source: 'SourceFile') -> ty.Iterable['Chunk']:
                 for component in used_components(source):
                     for chunk in component.exposed_content:
-                        yield str(chunk).strip()
+                        yield chunk.strip(allow_empty=True)
 
-            def source_hashes() -> ty.Iterable[int]:
+            def source_hashes() -> ty.Iterable[bytes]:
                 for source in self.sources:
                     if source.is_header:
-                        yield iter_hash(used_chunk_strings(source))
+                        yield iter_hash(used_chunks(source))
                     else:
                         yield source.stripped_hash
 
             self._used_content_hash = join_hashes(source_hashes())
+            self._used_names = {}
+            for source in self.sources:
+                names = visited & source.content.constructs.keys()
+                if source.is_header and names:
+                    self._used_names[source.hex] = sorted(names)
+            self._hashed_stats = stats
         return self._used_content_hash
 
+    @property
+    def used_names(self) -> ty.Dict[str, ty.List[str]]:
+        """
+        Gets names of the constructs used by the object, that are
+        produced by each of its headers.
+        :return: dict of construct name lists by source hex. Headers
+                    from which no constructs are used are left out.
+        :rtype: Dict[str, List[str]]
+        """
+        self.used_content_hash  # Finds used names.
+        return self._used_names
+
+    def _remembered_hash(
+            self
+    ) -> ty.Optional[ty.Tuple[bytes, ty.Dict[str, ty.List[str]]]]:
+        """
+        Gets the used content hash of the object as it was remembered,
+        if no construct that the object used then has since changed.
+
+        The object is unaffected if each source with substantive
+        changes is a header, and the constructs changed within it,
+        found from its remembered tree, include none of the constructs
+        that the object used from it. The content used by the object
+        then need not be found again.
+
+        :return: remembered hash and used names, or None if the object
+                    may be affected by changes, or was not remembered.
+        :rtype: Optional[Tuple[bytes, Dict[str, List[str]]]]
+        """
+        if self.build_dir is None:
+            return None
+        store = self.build_dir.store
+        try:
+            cached_hash = store.hashes[self.hex]
+            used_names = store.uses[self.hex]
+        except KeyError:
+            return None
+        for source in self.sources:
+            if not source.substantive_changes(store):
+                continue
+            if not source.is_header:
+                return None
+            changed = source.changed_constructs(store.trees)
+            if changed is None or \
+                    not changed.isdisjoint(used_names.get(source.hex, ())):
+                return None
+        verbose(f'{repr(self)} uses no changed constructs.')
+        return cached_hash, used_names
+
+    @property
+    def hashed(self) -> bool:
+        """
+        Checks whether the used content hash of the object is known,
+        and has been found since the last change to any source.
+        :return: bool
+        """
+        return self._used_content_hash is not None and \
+            self._hashed_stats == [source.stat for source in self.sources]
+
+    def set_used_content_hash(
+            self,
+            used_content_hash: bytes,
+            used_names: ty.Dict[str, ty.List[str]]
+    ) -> None:
+        """
+        Sets used content hash of the object, as computed elsewhere,
+        such as by a worker process.
+        :param used_content_hash: bytes
+        :param used_names: names of constructs used from each header.
+        :return: None
+        """
+        self._used_content_hash = used_content_hash
+        self._used_names = used_names
+        self._hashed_stats = [source.stat for source in self.sources]
+
     def create_constructs(self) -> ty.Dict[str, 'Construct']:
         """
         Gets constructs produced by sources used by CompileObject.
+
+        The construct tables of each source are shared between all
+        objects using that source, so they are merged here rather than
+        modified. Constructs which appear in only a single source are
+        used as-is.
+
         :return: dict of constructs by name str.
         :rtype Dict[str, Construct]
         """
-        def recurse_component(component_: 'Component'):
-            yield component_
-            for sub_component in component_.sub_components:
-                yield from recurse_component(sub_component)
-
         constructs: ty.Dict[str, 'Construct'] = {}
         for source in self.sources:
-            for component in recurse_component(source.content.component):
-                for name, content in component.construct_content.items():
-                    try:
-                        construct = constructs[name]
-                    except KeyError:
-                        construct = constructs[name] = Construct(name)
-                    construct.add_content(content)
+            for name, construct in source.content.constructs.items():
+                try:
+                    constructs[name] = constructs[name].merge(construct)
+                except KeyError:
+                    constructs[name] = construct
         return constructs
 
     @property
@@ -590,40 +1250,130 @@ class SourceFile:
         if hasattr(self, '_initialized'):
             return
         self.path = path
-        self._access_time: ty.Optional[float] = None
+        self.parse_cache: ty.Optional['ParseCache'] = None
+        self.stat_cache: ty.Optional['StatCache'] = None
+        self._content_stat: ty.Optional['FileStat'] = None
         self._content: ty.Optional['SourceContent'] = None
+        self._hashed_stat: ty.Optional['FileStat'] = None
+        self._stripped_hash: ty.Optional[bytes] = None
+        self._digest_stat: ty.Optional['FileStat'] = None
+        self._raw_digest: ty.Optional[bytes] = None
+        self._tree_stat: ty.Optional['FileStat'] = None
+        self._tree: ty.Optional['SourceTree'] = None
+        self._changes: ty.Optional[ty.Tuple[
+            'SourceTree', ty.Any, ty.Optional[ty.Set[str]]]] = None
         self._initialized = True
 
     @classmethod
     def clear(cls) -> None:
         cls._source_files.clear()
 
-    def substantive_changes(self, cache: ty.Dict[str, int]) -> bool:
+    def substantive_changes(self, store: 'HashStore') -> bool:
         """
-        Check for changes against cache.
+        Check for changes against the remembered hash of the source.
+
+        If the bytes of the file are unchanged since it was remembered,
+        its content is not read as text, stripped, or hashed.
 
-        :param cache: SourceCache
+        :param store: HashStore
         :return: bool which is True if changes have occurred.
         """
+        if self.bytes_unchanged(store):
+            return False
         try:
-            return self.stripped_hash != cache[self.hex]
+            return self.stripped_hash != store.hashes[self.hex]
         except KeyError:
             return True
 
-    def remember(self, cache: ty.Dict[str, int]) -> None:
-        cache[self.hex] = self.stripped_hash
+    def bytes_unchanged(self, store: 'HashStore') -> bool:
+        """
+        Checks whether the bytes of the file are the same as when the
+        source was last remembered, such as when only its modification
+        time has been changed by a checkout.
+
+        The file is read only if its size is the same as the
+        remembered size.
+
+        :param store: HashStore
+        :return: True if the size and raw digest of the file match
+                    those that were remembered.
+        """
+        try:
+            digest = store.digests[self.hex]
+            stamp = store.stamps[self.hex]
+        except KeyError:
+            return False
+        if FileStat(*stamp).size != self.stat.size:
+            return False
+        return self.raw_digest == digest
+
+    def changed_constructs(
+            self,
+            trees: 'CacheTable'
+    ) -> ty.Optional[ty.Set[str]]:
+        """
+        Finds constructs of the source which have changed since the
+        source was last remembered.
+
+        The changes are kept until either the tree of the source or the
+        remembered tree changes, so that they are found only once for
+        all objects using the source.
+
+        :param trees: CacheTable of remembered trees.
+        :return: Set of names of changed constructs, or None if the
+                    source's tree was not remembered, or if any user of
+                    the source may be affected.
+        :rtype: Optional[Set[str]]
+        """
+        tree = self.tree
+        try:
+            old = trees[self.hex]
+        except KeyError:
+            return None
+        if tree is None:
+            return None
+        if self._changes is None or self._changes[0] is not tree or \
+                self._changes[1] is not old:
+            changed = tree.changed_constructs(old)
+            self._changes = tree, old, changed
+        return self._changes[2]
+
+    def remember(self, store: 'HashStore') -> None:
+        if self.bytes_unchanged(store):
+            return  # Remembered hashes and tree are still current.
+        store.hashes[self.hex] = self.stripped_hash
+        store.digests[self.hex] = self.raw_digest
+        if not self.is_header:
+            return
+        tree = self.tree
+        if tree is None:
+            store.trees.pop(self.hex)
+        else:
+            store.trees[self.hex] = tree
 
     @property
     def is_header(self) -> bool:
         return self.path.suffix in HEADER_EXT
 
     @property
-    def m_time(self) -> float:
+    def stat(self) -> 'FileStat':
+        """
+        Gets stat of source file, from the stat cache of the build
+        if one has been assigned.
+        :return: FileStat
+        :raises FileNotFoundError if file does not exist.
+        """
+        if self.stat_cache is None:
+            return FileStat.of(self.path)
+        return self.stat_cache.stat(self.path)
+
+    @property
+    def m_time(self) -> int:
         """
         Gets modification time of source file.
-        :return: float time in seconds since epoch.
+        :return: int time in nanoseconds since epoch.
         """
-        return os.path.getmtime(self.path.absolute())
+        return self.stat.m_time
 
     @property
     def content(self) -> 'SourceContent':
@@ -634,16 +1384,77 @@ class SourceFile:
                     SourceFile's content.
         :rtype: SourceContent
         """
-        if self._content is None or self.m_time > self._access_time:
-            self._access_time = time.time()
-            with self.path.open() as f:
-                self._content = SourceContent(f)
+        stat = self.stat
+        if self._content is None or stat != self._content_stat:
+            self._content_stat = stat
+            self._content = SourceContent.load(self.path, self.parse_cache)
         return self._content
 
     @property
-    def stripped_hash(self) -> int:
+    def raw_digest(self) -> bytes:
+        """
+        Gets hash of the bytes of the file, as they are on disk.
+
+        The digest is kept until the stat of the file changes.
+        :return: bytes hash of HASH_SIZE.
+        """
+        stat = self.stat
+        if self._raw_digest is None or stat != self._digest_stat:
+            hasher = hashlib.blake2b(digest_size=HASH_SIZE)
+            with self.path.open('rb') as f:
+                for block in iter(lambda: f.read(DIGEST_BLOCK_SIZE), b''):
+                    hasher.update(block)
+            self._digest_stat = stat
+            self._raw_digest = hasher.digest()
+        return self._raw_digest
+
+    @property
+    def stripped_hash(self) -> bytes:
+        """
+        Gets stripped hash of the source's content, unless a hash was
+        set for the file's current stat.
+        :return: bytes
+        """
+        if self._stripped_hash is not None and self._hashed_stat == self.stat:
+            return self._stripped_hash
         return self.content.stripped_hash
 
+    def set_stripped_hash(self, stripped_hash: bytes) -> None:
+        """
+        Sets stripped hash of the source's content, as computed
+        elsewhere, such as by a worker process.
+
+        The hash is used only while the stat of the file is unchanged.
+        :param stripped_hash: bytes
+        :return: None
+        """
+        self._hashed_stat = self.stat
+        self._stripped_hash = stripped_hash
+
+    @property
+    def tree(self) -> ty.Optional['SourceTree']:
+        """
+        Gets Merkle hashes of the source's component tree, unless a
+        tree was set for the file's current stat.
+        :return: SourceTree, or None if content could not be parsed.
+        :rtype: Optional[SourceTree]
+        """
+        if self._tree_stat is not None and self._tree_stat == self.stat:
+            return self._tree
+        return self.content.tree
+
+    def set_tree(self, tree: ty.Optional['SourceTree']) -> None:
+        """
+        Sets Merkle hashes of the source's component tree, as computed
+        elsewhere, such as by a worker process.
+
+        The tree is used only while the stat of the file is unchanged.
+        :param tree: SourceTree, or None if content could not be parsed.
+        :return: None
+        """
+        self._tree_stat = self.stat
+        self._tree = tree
+
     @property
     def hex(self) -> str:
         """
@@ -656,77 +1467,405 @@ class SourceFile:
         return f'SourceFile[{os.path.basename(str(self.path))}]'
 
 
+def _init_hash_worker(parse_cache_path: str, verbose_: bool) -> None:
+    """
+    Initializes a worker process used by BuildDir.hash_objects.
+    :param parse_cache_path: path to parse cache directory.
+    :param verbose_: value of verbose option in parent process.
+    :return: None
+    """
+    global verbose_opt, worker_parse_cache, worker_stat_cache
+    verbose_opt = verbose_
+    worker_parse_cache = ParseCache(Path(parse_cache_path))
+    worker_stat_cache = StatCache()
+
+
+def _hash_object(
+        job: ty.Tuple[int, ty.List[str]]
+) -> ty.Tuple[
+    int,
+    bytes,
+    ty.Dict[str, ty.List[str]],
+    ty.List[bytes],
+    ty.List[ty.Optional['SourceTree']]
+]:
+    """
+    Hashes an object within a worker process.
+
+    Sources are kept between jobs, so a header shared by several
+    objects is parsed at most once per worker.
+
+    :param job: index of the object, and paths of the object's sources.
+    :return: index of the object, used content hash and used names of
+                the object, the stripped hash of each of its sources,
+                and the tree of each of its sources, or None for
+                sources that are not headers or could not be parsed.
+    :rtype: Tuple[int, bytes, Dict[str, List[str]], List[bytes],
+                List[Optional[SourceTree]]]
+    """
+    i, source_paths = job
+    sources = [Path(path) for path in source_paths]
+    for path in sources:
+        source = SourceFile(path)
+        source.parse_cache = worker_parse_cache
+        source.stat_cache = worker_stat_cache
+    obj = CompileObject(Path(), sources, None)
+    return (i, obj.used_content_hash, obj.used_names,
+            [source.stripped_hash for source in obj.sources],
+            [source.tree if source.is_header else None
+             for source in obj.sources])
+
+
 #######################################################################
 # Source analysis
 
 
 class SourceContent:
+    """
+    Content of a single source, in each of its forms.
+
+    The content of each form is kept only as a single contiguous str.
+    Lines are views which slice the str of a form when their content
+    is needed, so that no str is kept for each line.
+    """
     path: Path
-    lines: ty.List['Line']
-    _raw_hash: ty.Optional[int]
+    _raw_hash: ty.Optional[bytes]
+
+    def __init__(
+            self,
+            content: ty.Union[str, bytes, mmap.mmap, ty.TextIO],
+            parse_cache: ty.Optional['ParseCache'] = None
+    ) -> None:
+        """
+        Creates a new SourceContent from passed source code.
 
-    def __init__(self, content: ty.Union[str, ty.TextIO]) -> None:
+        :param content: str, encoded bytes or memory map, or text file
+                    containing source code.
+        :param parse_cache: Optional ParseCache from which the content's
+                    components may be restored, rather than parsed.
+        """
+        self.parse_cache = parse_cache
         if isinstance(content, str):
-            self.lines = self._lines_from_str(content)
+            text = content
+        elif isinstance(content, (bytes, mmap.mmap)):
+            text = self._decode(content)
         else:
-            self.lines = self._lines_from_f(content)
-        self._raw_hash: ty.Optional[int] = None
+            text = content.read()
+        self._texts: ty.Dict['SourceForm', str] = {SourceForm.RAW: text}
+        # Lines are split only on newline chars, as they are when
+        # read from a file.
+        self._line_count = text.count('\n') + (
+            bool(text) and not text.endswith('\n'))
+        self._lines: ty.Optional[ty.List['Line']] = None
+        self._raw_hash: ty.Optional[bytes] = None
         self._stripped_comments: bool = False
         self._component: ty.Optional['Block'] = None
-        self._constructs: ty.Dict[str, 'Construct'] = None
+        self._constructs: ty.Optional[ty.Dict[str, 'Construct']] = None
+        self._tree: ty.Optional['SourceTree'] = None
+        self._tree_failed = False
         self._chunk: ty.Optional['Chunk'] = None
+        self._line_starts: ty.Dict['SourceForm', ty.Sequence[int]] = {}
+        self._tokens: ty.Dict['SourceForm', ty.List['Token']] = {}
+        self._token_starts: ty.Dict['SourceForm', ty.List[int]] = {}
+        self._words: ty.Dict['SourceForm', ty.Tuple[
+            ty.Sequence[int], ty.Sequence[int], ty.List[str]]] = {}
+        self._bracket_pairs: ty.Dict['SourceForm', ty.Dict[int, int]] = {}
+        self._comment_spans: ty.List[ty.Tuple[int, int]] = []
 
-    def strip_comments(self) -> None:
+    @classmethod
+    def load(
+            cls,
+            path: Path,
+            parse_cache: ty.Optional['ParseCache'] = None
+    ) -> 'SourceContent':
         """
-        Removes comments from all lines in content.
-        :return: None
+        Creates a new SourceContent from the file at the passed path.
+
+        The file is memory mapped and decoded as a whole, rather than
+        read line by line.
+
+        :param path: path to source file.
+        :param parse_cache: Optional ParseCache from which the content's
+                    components may be restored, rather than parsed.
+        :return: SourceContent
+        """
+        with path.open('rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty files cannot be mapped.
+                return cls(b'', parse_cache)
+            with buffer:
+                return cls(buffer, parse_cache)
+
+    @property
+    def lines(self) -> ty.List['Line']:
+        """
+        Gets a view of each line of the content.
+        :return: List of Lines.
+        :rtype: List[Line]
+        """
+        if self._lines is None:
+            self._lines = [Line(self, i) for i in range(self._line_count)]
+        return self._lines
+
+    def strip_comments(self) -> None:
+        """
+        Removes comments from all lines in content.
+
+        Comments are found in a single pass over the full raw text,
+        which also finds literals, so that comment delimiters within
+        literals are left intact. A comment which spans multiple lines
+        is replaced by the newline chars it contains, and any other
+        block comment is replaced by a single space.
+
+        :return: None
         """
         if self._stripped_comments:
             raise ValueError('Already stripped comments')
-        in_block: bool = False
-        for line in self.lines:
-            s: str = line.raw
-            i: int = 0
-            chunks: ty.List[str] = []
-            while True:
-                if in_block:
-                    end_index = s.find('*/', i)
-                    if end_index == -1:
-                        break
-                    i = end_index + len('*/')
-                    in_block = False
-                else:
-                    start_index = s.find('/*', i)
-                    chunk_end = start_index if start_index != -1 else None
-                    # Add found useful code to chunks
-                    chunks.append(s[i:chunk_end])
-                    if start_index == -1:
-                        break
-                    i = start_index + len('/*')
-                    in_block = True
-            unblocked = ' '.join(chunks)
-            line_comment_start = unblocked.find('//')
-            if line_comment_start == -1:
-                uncommented = unblocked
-            else:
-                uncommented = unblocked[:line_comment_start]
-            if line.raw.endswith('\n') and not uncommented.endswith('\n'):
-                uncommented += '\n'
-            line.uncommented = uncommented
+        raw = self.text(SourceForm.RAW)
+        comment_spans = self._find_comments(raw)
+        chunks: ty.List[str] = []
+        i = 0
+        for start, end in comment_spans:
+            chunks.append(raw[i:start])
+            newlines = raw.count('\n', start, end)
+            if newlines:
+                chunks.append('\n' * newlines)
+            elif raw.startswith('/*', start):
+                chunks.append(' ')
+            i = end
+        chunks.append(raw[i:])
+        self._texts[SourceForm.UNCOMMENTED] = ''.join(chunks)
+        self._comment_spans = comment_spans
         self._stripped_comments = True
 
+    def comment_spans(self) -> ty.List[ty.Tuple[int, int]]:
+        """
+        Gets the span of each comment within the raw text of the
+        source, as found when stripping comments.
+
+        :return: List of (start, end) offset tuples into RAW form text,
+                    ordered by offset. End offsets are exclusive.
+        :rtype: List[Tuple[int, int]]
+        """
+        if not self._stripped_comments:
+            self.strip_comments()
+        return self._comment_spans
+
     def start_pos(self, form: 'SourceForm') -> 'SourcePos':
-        return SourcePos(self, 0, 0, form)
+        return SourcePos.from_offset(self, 0, form)
 
     def end_pos(self, form: 'SourceForm') -> 'SourcePos':
-        return SourcePos(self, -1, len(self.lines[-1].s(form)), form)
+        return SourcePos.from_offset(self, len(self.text(form)), form)
+
+    def text(self, form: 'SourceForm') -> str:
+        """
+        Gets the full content of the source as a single contiguous
+        str in the passed form.
+
+        The str is produced once per form, and is used to address
+        source by integer offset rather than by line and column.
+        The STRIPPED form collapses each run of whitespace within a
+        line of the UNCOMMENTED form into a single space, and removes
+        whitespace from the ends of each line.
+
+        :param form: SourceForm; RAW, UNCOMMENTED, or STRIPPED
+        :return: str of full source content.
+        :rtype: str
+        """
+        try:
+            return self._texts[form]
+        except KeyError:
+            pass
+        if not self._stripped_comments:
+            self.strip_comments()
+        if form == SourceForm.STRIPPED:
+            self._texts[form] = '\n'.join(
+                ' '.join(line_s.split()) for line_s in
+                self._texts[SourceForm.UNCOMMENTED].split('\n'))
+        return self._texts[form]
+
+    def line_starts(self, form: 'SourceForm') -> ty.Sequence[int]:
+        """
+        Gets the offset at which each line begins within the
+        contiguous text of the passed form.
+
+        Offsets are kept in an unsigned int array rather than a list,
+        so that no int object is kept for each line.
+
+        :param form: SourceForm; RAW, UNCOMMENTED, or STRIPPED
+        :return: array of int offsets, one per line.
+        :rtype: Sequence[int]
+        """
+        try:
+            return self._line_starts[form]
+        except KeyError:
+            pass
+        # Each form has the same newline chars, so each line but the
+        # last begins after a newline char.
+        newlines = NEWLINE_PATTERN.finditer(self.text(form))
+        self._line_starts[form] = starts = array('I', [0])
+        starts.extend(
+            match.end() for match in
+            itertools.islice(newlines, max(self._line_count - 1, 0)))
+        return starts
+
+    def token_stream(
+            self,
+            form: 'SourceForm' = None
+    ) -> ty.List['Token']:
+        """
+        Gets tokens produced by lexing the contiguous text of the
+        passed form. The text is lexed only once per form.
+
+        :param form: SourceForm; STRIPPED by default.
+        :return: List of Tokens, ordered by offset.
+        :rtype: List[Token]
+        """
+        form = form or SourceForm.STRIPPED
+        try:
+            return self._tokens[form]
+        except KeyError:
+            pass
+        self._tokens[form] = tokens = lex(self.text(form))
+        self._token_starts[form] = [token.start for token in tokens]
+        return tokens
+
+    def token_index(self, offset: int, form: 'SourceForm' = None) -> int:
+        """
+        Finds index within the token stream of the first token which
+        begins at or after the passed offset.
+
+        :param offset: int offset within text of the passed form.
+        :param form: SourceForm; STRIPPED by default.
+        :return: int token index.
+        :rtype: int
+        """
+        form = form or SourceForm.STRIPPED
+        if form not in self._token_starts:
+            self.token_stream(form)
+        return bisect.bisect_left(self._token_starts[form], offset)
+
+    def words(
+            self,
+            start: int,
+            end: int,
+            form: 'SourceForm' = None
+    ) -> ty.List[str]:
+        """
+        Gets the words matched by WORD_REGEX within a span of the text
+        of the passed form.
+
+        The words of the whole text are found once per form, and are
+        interned, so that each distinct word is kept only once and may
+        be compared by identity when looked up. Words of a span are
+        then found by bisecting the table of word offsets. A word which
+        crosses a bound of the span is cut at it, as it would be if the
+        text of the span were searched.
+
+        :param start: int offset of start of span.
+        :param end: int offset of end of span. Exclusive.
+        :param form: SourceForm; STRIPPED by default.
+        :return: List of word strs, ordered by offset.
+        :rtype: List[str]
+        """
+        form = form or SourceForm.STRIPPED
+        try:
+            starts, ends, words = self._words[form]
+        except KeyError:
+            starts, ends, words = array('I'), array('I'), []
+            intern = sys.intern
+            for match in WORD_PATTERN.finditer(self.text(form)):
+                starts.append(match.start())
+                ends.append(match.end())
+                words.append(intern(match.group()))
+            self._words[form] = starts, ends, words
+        if start >= end:
+            return []
+        first = bisect.bisect_right(ends, start)
+        last = bisect.bisect_left(starts, end)
+        result = words[first:last]
+        if result:
+            text = self.text(form)
+            if starts[first] < start:
+                result[0] = sys.intern(text[start:ends[first]])
+            if ends[last - 1] > end:
+                result[-1] = sys.intern(
+                    text[max(starts[last - 1], start):end])
+        return result
+
+    def bracket_pairs(self, form: 'SourceForm' = None) -> ty.Dict[int, int]:
+        """
+        Gets table of the offset of the closing bracket paired with each
+        opening bracket in the text of the passed form.
+
+        The table is built by a single stack-based pass over the
+        token stream, so bracket chars within literals or preprocessor
+        directives are not paired. Each kind of bracket is paired
+        independently of the others. Opening brackets with no pair
+        are absent from the table. A '>>' token closes two angle
+        brackets, as in nested template arguments, only if two are
+        open; otherwise it is a shift operator.
+
+        :param form: SourceForm; STRIPPED by default.
+        :return: dict of closing bracket offsets by opening
+                    bracket offset.
+        :rtype: Dict[int, int]
+        """
+        form = form or SourceForm.STRIPPED
+        try:
+            return self._bracket_pairs[form]
+        except KeyError:
+            pass
+        openers = {close: bracket for bracket, close in BRACKETS.items()}
+        stacks: ty.Dict[str, ty.List[int]] = {b: [] for b in BRACKETS}
+        pairs: ty.Dict[int, int] = {}
+        for token in self.token_stream(form):
+            if token.type != TokenType.BRACKET:
+                if token.s == '>>' and len(stacks['<']) >= 2:
+                    pairs[stacks['<'].pop()] = token.start
+                    pairs[stacks['<'].pop()] = token.start + 1
+                continue
+            try:
+                stacks[token.s].append(token.start)
+            except KeyError:
+                stack = stacks[openers[token.s]]
+                if stack:
+                    pairs[stack.pop()] = token.start
+        self._bracket_pairs[form] = pairs
+        return pairs
+
+    @staticmethod
+    def _find_comments(text: str) -> ty.List[ty.Tuple[int, int]]:
+        """
+        Finds comments within passed text, skipping over literals.
+
+        :param text: source text.
+        :return: List of comment spans, ordered by offset.
+        """
+        return [match.span() for match in LITERAL_SCAN_PATTERN.finditer(text)
+                if match.lastgroup == 'comment']
+
+    def line_index(self, offset: int, form: 'SourceForm') -> int:
+        """
+        Finds index of the line containing the passed offset.
+
+        An offset at the end of a line (after its newline char) is
+        considered to be part of the following line, if one exists.
+
+        :param offset: int offset within text of the passed form.
+        :param form: SourceForm; RAW, UNCOMMENTED, or STRIPPED
+        :return: int line index.
+        :rtype: int
+        """
+        return bisect.bisect_right(self.line_starts(form), offset) - 1
 
     @property
     def has_uncommented(self) -> bool:
         return self._stripped_comments
 
     @property
-    def stripped_hash(self) -> int:
+    def stripped_hash(self) -> bytes:
         """
         Gets hash of raw content, before documentation has been
         stripped from it.
@@ -738,7 +1877,7 @@ class SourceContent:
             self._raw_hash = iter_hash(
                 line.stripped.strip()  # remove newline, etc.
                 for line in self.lines if line.stripped != '\n')
-        assert isinstance(self._raw_hash, int)
+        assert isinstance(self._raw_hash, bytes)
         return self._raw_hash
 
     @property
@@ -749,60 +1888,124 @@ class SourceContent:
         :rtype: Block
         """
         if self._component is None:
-            self._component = Block(self)
+            if self.parse_cache is not None:
+                self._component = self.parse_cache.load(self)
+            if self._component is None:
+                self._component = Block(self)
+                if self.parse_cache is not None:
+                    self.parse_cache.store(self, self._component)
         assert isinstance(self._component, Block)
         return self._component
 
-    @staticmethod
-    def _lines_from_str(content: str) -> ty.List['Line']:
-        return [Line(i, line_s) for i, line_s in
-                enumerate(content.splitlines(True))]
+    @property
+    def constructs(self) -> ty.Dict[str, 'Construct']:
+        """
+        Gets table of the constructs produced by the source's content.
+
+        The table is built once per SourceContent and shared by every
+        CompileObject which uses the source, and so should not
+        be modified.
+
+        :return: dict of Constructs by name str.
+        :rtype: Dict[str, Construct]
+        """
+        if self._constructs is None:
+            def recurse_component(component: 'Component'):
+                yield component
+                for sub_component in component.sub_components:
+                    yield from recurse_component(sub_component)
+
+            content: ty.Dict[str, ty.List['Component']] = {}
+            for component in recurse_component(self.component):
+                update_content(content, component.construct_content)
+            self._constructs = {
+                name: Construct(name, components)
+                for name, components in content.items()
+            }
+        return self._constructs
+
+    @property
+    def tree(self) -> ty.Optional['SourceTree']:
+        """
+        Gets Merkle hashes of the content's component tree.
+
+        Finding the tree parses all of the content's components, so
+        if any part of the content cannot be parsed, no tree is found,
+        leaving the error to be raised if that part is used.
+        :return: SourceTree, or None if content could not be parsed.
+        :rtype: Optional[SourceTree]
+        """
+        if self._tree is None and not self._tree_failed:
+            try:
+                block = self.component
+                self._tree = SourceTree(
+                    block.content_hash,
+                    join_hashes(component.exposed_hash
+                                for component in block.sub_components),
+                    {name: join_hashes(component.content_hash
+                                       for component in construct.content)
+                     for name, construct in self.constructs.items()}
+                )
+            except (ParsingException, ValueError, KeyError, IndexError):
+                verbose(f'No tree found for {self}; parse failed.')
+                self._tree_failed = True
+        return self._tree
+
+    @property
+    def digest(self) -> str:
+        """
+        Gets hex digest of the raw content of the source.
+        :return: str
+        """
+        return hashlib.md5(self.text(SourceForm.RAW).encode()).hexdigest()
 
     @staticmethod
-    def _lines_from_f(f: ty.TextIO) -> ty.List['Line']:
-        return [Line(i, line_s) for i, line_s in enumerate(f.readlines())]
+    def _decode(buffer: ty.Union[bytes, mmap.mmap]) -> str:
+        """
+        Decodes the bytes of a source file, translating newlines as
+        they are when the file is read in text mode.
+        :param buffer: bytes or memory map of file.
+        :return: str
+        """
+        text = str(buffer, 'utf-8')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
 
 
 class Line:
     """
-    Data storage class for storing information about a line of source.
+    View of a single line of a SourceContent.
+
+    The content of the line in each form is sliced from the contiguous
+    text of that form when it is accessed, rather than being stored.
     """
 
-    def __init__(self, i: int, s: str) -> None:
+    __slots__ = 'file_content', 'index'
+
+    def __init__(self, file_content: 'SourceContent', i: int) -> None:
+        self.file_content = file_content
         self.index = i
-        self.raw = s
-        self._uncommented: ty.Optional[str] = None
+
+    @property
+    def raw(self) -> str:
+        return self.s(SourceForm.RAW)
 
     @property
     def uncommented(self) -> str:
         """
-        Since the 'uncommented' value of a Line is set externally,
-        this property exists to check that it is not accessed before
-        it has been calculated, to avoid silent failure.
+        Gets the content of the line with comments removed. Comments
+        are stripped from the whole SourceContent if they have not
+        been already.
 
         :return: str of uncommented content of line.
         """
-        if self._uncommented is None:
-            raise AttributeError(
-                f'Uncommented value of {repr(self)} has not been set.')
-        return self._uncommented
-
-    @uncommented.setter
-    def uncommented(self, s: str) -> None:
-        """
-        Used by SourceContent to set Line instance's uncommented str.
-        :param s: uncommented content str
-        :return: None
-        """
-        self._uncommented = s
+        return self.s(SourceForm.UNCOMMENTED)
 
     @property
     def stripped(self) -> str:
-        s = ' '.join(self.uncommented.split())
-        if self.uncommented.endswith('\n'):
-            s += '\n'
-        return s
-    
+        return self.s(SourceForm.STRIPPED)
+
     def s(self, form: 'SourceForm') -> str:
         """
         Gets line string in the specified form.
@@ -810,22 +2013,19 @@ class Line:
         :param form: SourceForm; RAW, UNCOMMENTED, or STRIPPED
         :return: str of line content.
         :rtype: str
-        :raises ValueError if uncommented form has not been set and
-                    UNCOMMENTED or STRIPPED form is passed as an arg.
         """
-        if form == SourceForm.RAW:
-            return self.raw
-        if form == SourceForm.UNCOMMENTED:
-            return self.uncommented
-        if form == SourceForm.STRIPPED:
-            return self.stripped
+        starts = self.file_content.line_starts(form)
+        i = self.index
+        end = starts[i + 1] if i + 1 < len(starts) else None
+        return self.file_content.text(form)[starts[i]:end]
 
     def __repr__(self) -> str:
         preview_len = 40
+        raw = self.raw
         # Produces Line[i: index, s: preview + '...' if preview runs over]
         return f'Line[i: {self.index}, ' \
-               f'\'{self.raw[:preview_len]}' \
-               f'{"..." if len(self.raw) > preview_len else ""}\']'
+               f'\'{raw[:preview_len]}' \
+               f'{"..." if len(raw) > preview_len else ""}\']'
 
 
 class SourceForm(enum.Enum):
@@ -837,8 +2037,14 @@ class SourceForm(enum.Enum):
 class SourcePos:
     """
     Class storing position within source.
+
+    Positions are stored as an int offset into the contiguous text of
+    the SourceContent in the position's form. Line and column indices
+    are derived from the offset when accessed.
     """
 
+    __slots__ = 'file_content', 'form', 'offset', '_line_i'
+
     def __init__(
             self,
             file_content: 'SourceContent',
@@ -848,16 +2054,37 @@ class SourcePos:
     ) -> None:
         self.file_content = file_content
         self.form = form
-        if not self.file_content.has_uncommented and form in (
-                SourceForm.UNCOMMENTED, SourceForm.STRIPPED):
-            self.file_content.strip_comments()
-        self.line_i = self._normalize_line_i(line_i)
-        col_i = self._normalize_col_i(col_i)
-        if col_i == len(self.file_content.lines[line_i].s(self.form)) and \
-                self.line_i < len(self.file_content.lines) - 1:
-            self.line_i += 1
-            col_i = 0
-        self.col_i = col_i
+        line_starts = file_content.line_starts(form)
+        line_i = self._normalize_line_i(line_i)
+        col_i = self._normalize_col_i(line_i, col_i)
+        self.offset = line_starts[line_i] + col_i
+        self._line_i: ty.Optional[int] = None
+
+    @classmethod
+    def from_offset(
+            cls,
+            file_content: 'SourceContent',
+            offset: int,
+            form: 'SourceForm'
+    ) -> 'SourcePos':
+        """
+        Creates a SourcePos directly from an offset within the
+        contiguous text of the passed form.
+
+        The offset is not validated; callers are expected to pass an
+        offset within the bounds of the source text.
+
+        :param file_content: SourceContent containing position.
+        :param offset: int offset.
+        :param form: SourceForm of the text being addressed.
+        :return: SourcePos
+        """
+        pos = cls.__new__(cls)
+        pos.file_content = file_content
+        pos.form = form
+        pos.offset = offset
+        pos._line_i = None
+        return pos
 
     def __add__(self, n: int) -> 'SourcePos':
         """
@@ -869,29 +2096,14 @@ class SourcePos:
         :raise: ValueError if n is too large (either positive or
                     negative) to be added to the SourcePos.
         """
-        if n < 0:
-            return self - abs(n)
-        original_n = n
-        line = self.file_content.lines[self.line_i]
-        remaining_chars = len(line.s(self.form)) - self.col_i
-        if n <= remaining_chars:
-            return SourcePos(
-                self.file_content,
-                self.line_i,
-                self.col_i + n,
-                self.form
-            )
-        else:
-            n -= remaining_chars
-        for line in self.file_content.lines[self.line_i + 1:]:
-            line_chars = len(line.s(self.form))
-            if n <= line_chars:
-                return SourcePos(self.file_content, line.index, n, self.form)
-            n -= line_chars
-        else:
+        offset = self.offset + n
+        if not 0 <= offset <= len(self.file_content.text(self.form)):
+            if n < 0:
+                raise ValueError(
+                    f'Cannot subtract {-n} from {self}. {-n} is too large.')
             raise ValueError(
-                f'Cannot add {original_n} to {self}. '
-                f'{original_n} is too large.')
+                f'Cannot add {n} to {self}. {n} is too large.')
+        return SourcePos.from_offset(self.file_content, offset, self.form)
 
     def __sub__(self, n: int) -> 'SourcePos':
         """
@@ -903,32 +2115,7 @@ class SourcePos:
         :raise: ValueError if n is too large (either positive or
                     negative) to be subtracted from the SourcePos.
         """
-        if n < 0:
-            return self + abs(n)
-        original_n = n
-        remaining_chars = self.col_i
-        if n <= remaining_chars:
-            return SourcePos(
-                self.file_content,
-                self.line_i,
-                self.col_i - n,
-                self.form
-            )
-        else:
-            n -= remaining_chars
-        for line in reversed(self.file_content.lines[:self.line_i]):
-            line_chars = len(line.s(self.form))
-            if n <= line_chars:
-                return SourcePos(
-                    self.file_content,
-                    line.index,
-                    line_chars - n,
-                    self.form)
-            n -= line_chars
-        else:
-            raise ValueError(
-                f'Cannot subtract {original_n} from {self}. '
-                f'{original_n} is too large.')
+        return self + -n
 
     def __hash__(self) -> int:
         """
@@ -936,19 +2123,29 @@ class SourcePos:
         instances to have equal hashes.
         :return: int
         """
-        return hash((self.file_content, self.line_i, self.col_i, self.form))
+        return hash((self.file_content, self.offset, self.form))
 
     def __eq__(self, other) -> bool:
         try:
             return all((
                 self.file_content == other.file_content,
-                self.line_i == other.line_i,
-                self.col_i == other.col_i,
+                self.offset == other.offset,
                 self.form == other.form
             ))
         except AttributeError:
             return False
 
+    @property
+    def line_i(self) -> int:
+        if self._line_i is None:
+            self._line_i = self.file_content.line_index(self.offset, self.form)
+        return self._line_i
+
+    @property
+    def col_i(self) -> int:
+        return self.offset - self.file_content.line_starts(
+            self.form)[self.line_i]
+
     @property
     def next_line_pos(self) -> 'SourcePos':
         return SourcePos(self.file_content, self.line_i + 1, 0, self.form)
@@ -964,16 +2161,16 @@ class SourcePos:
                 f'{len(lines)} lines exist in {self.file_content}')
         return i
 
-    def _normalize_col_i(self, i: int) -> int:
+    def _normalize_col_i(self, line_i: int, i: int) -> int:
         original_i = i
-        line = self.file_content.lines[self.line_i]
+        line = self.file_content.lines[line_i]
         line_len = len(line.s(self.form))
         if i < 0:
             i += line_len
         if not 0 <= i <= line_len:
             raise IndexError(
                 f'Column index invalid: {original_i}. '
-                f'Line {self.line_i} is {line_len} chars long.')
+                f'Line {line_i} is {line_len} chars long.')
         return i
 
     def __repr__(self) -> str:
@@ -985,8 +2182,16 @@ class Chunk:
     Intermediate class used to store data about code and provide
     convenience accessors to help determine what kind of Component(s)
     are stored within the Chunk's code.
+
+    Chunk content is accessed through offsets into the contiguous text
+    of its SourceContent, so that character access does not depend
+    on the number of lines spanned by the Chunk. Only the offsets of
+    the start and end of the Chunk are stored; positions and lines are
+    found from them when accessed.
     """
 
+    __slots__ = 'file_content', 'form', '_text', 'start_offset', 'end_offset'
+
     def __init__(
             self,
             file_content: 'SourceContent',
@@ -996,27 +2201,77 @@ class Chunk:
     ) -> None:
         self.file_content = file_content
         self.form = form
-        if not self.file_content.has_uncommented and form in (
-                SourceForm.UNCOMMENTED, SourceForm.STRIPPED):
-            self.file_content.strip_comments()
-        self._start = start or file_content.start_pos(form)
-        self._end = end or file_content.end_pos(form)
-        if self.start.line_i > self.end.line_i:
-            raise ValueError(
-                f'Start line index: {self.start.line_i} follows '
-                f'end line index: {self.end.line_i}.')
-        if self.start.line_i == self.end.line_i and \
-                self.start.col_i > self.end.col_i:
+        self._text = file_content.text(form)
+        self.start_offset = 0 if start is None else start.offset
+        self.end_offset = len(self._text) if end is None else end.offset
+        self._check_bounds()
+
+    @classmethod
+    def from_offsets(
+            cls,
+            file_content: 'SourceContent',
+            start: int,
+            end: int,
+            form: 'SourceForm' = SourceForm.STRIPPED
+    ) -> 'Chunk':
+        """
+        Creates a Chunk directly from offsets within the contiguous
+        text of the passed form.
+
+        The offsets are not validated; callers are expected to pass
+        ordered offsets within the bounds of the source text.
+
+        :param file_content: SourceContent containing Chunk.
+        :param start: int offset of start of Chunk.
+        :param end: int offset of end of Chunk. Exclusive.
+        :param form: SourceForm of the text being addressed.
+        :return: Chunk
+        """
+        chunk = cls.__new__(cls)
+        chunk.file_content = file_content
+        chunk.form = form
+        chunk._text = file_content.text(form)
+        chunk.start_offset = start
+        chunk.end_offset = end
+        return chunk
+
+    def span(self, start: int, end: int) -> 'Chunk':
+        """
+        Gets Chunk of the same source and form as this Chunk, between
+        the passed offsets, which are not validated.
+
+        :param start: int offset. Not relative to start of Chunk.
+        :param end: int offset. Not relative to start of Chunk.
+        :return: Chunk
+        """
+        chunk = Chunk.__new__(Chunk)
+        chunk.file_content = self.file_content
+        chunk.form = self.form
+        chunk._text = self._text
+        chunk.start_offset = start
+        chunk.end_offset = end
+        return chunk
+
+    def _check_bounds(self) -> None:
+        """
+        Checks that the start of the Chunk does not follow its end.
+        :return: None
+        :raises ValueError if start follows end.
+        """
+        if self.start_offset <= self.end_offset:
+            return
+        start, end = self.start, self.end
+        if start.line_i > end.line_i:
             raise ValueError(
-                f'Start column: {self.start.line_i} follows '
-                f'end column: {self.end.col_i} when Chunk begins and ends '
-                f'on the same line.')
-        self.first_line = self.lines[0]
-        self.last_line = self.lines[-1]
-        self._index_range: ty.Optional[range] = None
+                f'Start line index: {start.line_i} follows '
+                f'end line index: {end.line_i}.')
+        raise ValueError(
+            f'Start column: {start.col_i} follows '
+            f'end column: {end.col_i} when Chunk begins and ends '
+            f'on the same line.')
 
     def __len__(self) -> int:
-        return self.index_range.stop
+        return self.end_offset - self.start_offset
 
     def __getitem__(
             self, i: ty.Union[int, 'SourcePos', slice]
@@ -1041,21 +2296,7 @@ class Chunk:
         Iterate over all characters in Chunk.
         :return: str iterable yielding each character in Chunk.
         """
-        if self.first_line is self.last_line:
-            line_s = self.first_line.s(self.form)
-            for c in line_s[self.start.col_i:self.end.col_i]:
-                yield c
-            return
-        for line in self.lines:
-            line_s = line.s(self.form)
-            if line is self.first_line:
-                s = line_s[self.start.col_i:]
-            elif line is self.last_line:
-                s = line_s[:self.end.col_i]
-            else:
-                s = line_s
-            for c in s:
-                yield c
+        return iter(str(self))
 
     def pos(self, line_i: int, col_i: ty.Union[str, int] = 0) -> 'SourcePos':
         """
@@ -1079,18 +2320,77 @@ class Chunk:
     def line(self, pos: 'SourcePos') -> 'Line':
         return self.file_content.lines[pos.line_i]
 
-    def tokenize(self, regex: str = r"[\w0-9]+") -> ty.List[str]:
-        tokens: ty.List[str] = []
-        if self.start.line_i == self.end.line_i:
-            return re.findall(regex, str(self))
-        for line in self.lines:
-            s = line.s(self.form)
-            if line == self.lines[0]:
-                s = s[self.start.col_i:]
-            elif line == self.lines[-1]:
-                s = s[:self.end.col_i]
-            tokens += re.findall(regex, s)
-        return tokens
+    def pos_at(self, offset: int) -> 'SourcePos':
+        """
+        Gets SourcePos at the passed offset within the contiguous text
+        of the Chunk's source, in the same form as the Chunk.
+
+        :param offset: int offset. Not relative to start of Chunk.
+        :return: SourcePos
+        :rtype: SourcePos
+        """
+        return SourcePos.from_offset(self.file_content, offset, self.form)
+
+    @property
+    def token_stream(self) -> ty.List['Token']:
+        """
+        Gets tokens which lie entirely within the Chunk.
+        :return: List of Tokens, ordered by offset.
+        :rtype: List[Token]
+        """
+        tokens = self.file_content.token_stream(self.form)
+        first = self.file_content.token_index(self.start_offset, self.form)
+        last = self.file_content.token_index(self.end_offset, self.form)
+        if last > first and tokens[last - 1].end > self.end_offset:
+            last -= 1
+        return tokens[first:last]
+
+    def scope_token_stream(
+            self,
+            angle_brackets: bool = True
+    ) -> ty.Iterable[ty.Tuple['Token', ty.Optional[int]]]:
+        """
+        Yields tokens in the highest level scope of the Chunk.
+
+        Opening brackets are yielded along with the offset of their
+        paired closing bracket, after which the bracketed content is
+        skipped. All other tokens are yielded with None.
+
+        :param angle_brackets: If False, '<' and '>' are treated as
+                    operators rather than brackets.
+        :return: Iterable of (Token, closing offset or None) tuples.
+        :raises ParsingException if an opening bracket has no pair
+                    within the Chunk.
+        """
+        content = self.file_content
+        tokens = content.token_stream(self.form)
+        i = content.token_index(self.start_offset, self.form)
+        end = self.end_offset
+        while i < len(tokens) and tokens[i].end <= end:
+            token = tokens[i]
+            if token.type != TokenType.BRACKET or token.s not in BRACKETS \
+                    or not angle_brackets and token.s == '<':
+                yield token, None
+                i += 1
+                continue
+            close = self.find_pair(self.pos_at(token.start)).offset
+            yield token, close
+            i = content.token_index(close + 1, self.form)
+
+    def tokenize(self, regex: str = WORD_REGEX) -> ty.List[str]:
+        """
+        Gets all tokens matched by the passed regex within the Chunk.
+
+        Words matched by the default regex are looked up from the word
+        table of the Chunk's source rather than searched for again.
+
+        :param regex: Optional regex to use for finding tokens.
+        :return: List[str]
+        """
+        if regex == WORD_REGEX:
+            return self.file_content.words(
+                self.start_offset, self.end_offset, self.form)
+        return re.findall(regex, str(self))
 
     def find_pair(self, start_pos: 'SourcePos') -> 'SourcePos':
         """
@@ -1099,60 +2399,82 @@ class Chunk:
 
         :param start_pos: SourcePos
         :return: SourcePos
+        :raises ParsingException if no pair exists within the Chunk.
         """
-        if not self[start_pos] in BRACKETS.keys():
+        begin_char = self[start_pos]
+        if begin_char not in BRACKETS.keys():
             raise ValueError(
                 f'Expected bracket in {BRACKETS.keys()} at '
-                f'start_pos: {start_pos}. Got: {self[start_pos]}')
-        sub_chunk = self[start_pos:]
-        depth = 0
-        begin_char = self[start_pos]
-        end_char = BRACKETS[begin_char]
-        pos = sub_chunk.start
-        while True:
-            try:
-                c = sub_chunk[pos]
-            except IndexError:
-                raise ParsingException(
-                    f'No end to bracket at {start_pos} found in {self}.')
-            if c == begin_char:
-                depth += 1
-            elif c == end_char:
-                depth -= 1
-                if depth == 0:
-                    return pos
-            elif c in '\'"':
-                pos = sub_chunk.find_quote_end(pos)
-            pos += 1
+                f'start_pos: {start_pos}. Got: {begin_char}')
+        pairs = self.file_content.bracket_pairs(self.form)
+        close = pairs.get(start_pos.offset)
+        if close is None or close >= self.end_offset:
+            raise ParsingException(
+                f'No end to bracket at {start_pos} found in {self}.')
+        return self.pos_at(close)
 
     def find_quote_end(self, pos: 'SourcePos') -> 'SourcePos':
-        escaped = False
-        end_char = self[pos]
-        if end_char not in '\'"':
+        """
+        Finds closing quote char of the literal whose opening quote
+        char is at the passed position, from the literal token
+        containing it in the token stream of the source.
+
+        :param pos: SourcePos of opening quote char.
+        :return: SourcePos of closing quote char.
+        :rtype: SourcePos
+        :raises ValueError if no literal begins at the passed position,
+                    or if the literal does not end within the Chunk.
+        """
+        quote = self[pos]
+        if quote not in '\'"':
             raise ValueError(
                 'Expected start of quote to begin with \' or \" character.')
-        for i, c in enumerate(self[pos + 1:]):
-            if escaped:
-                escaped = False
-            elif c == '\\':
-                escaped = True
-            elif c == '\n':
-                raise ValueError('End of line encountered while looking for '
-                                 f'string end for quote char at {pos}')
-            elif c == end_char:
-                return pos + i + 1
-
-    def strip(self) -> 'Chunk':
-        for i, c in enumerate(self):
-            if c not in string.whitespace:
-                start = i
-                break
-        else:
+        content = self.file_content
+        tokens = content.token_stream(self.form)
+        i = content.token_index(pos.offset + 1, self.form) - 1
+        token = tokens[i] if i >= 0 else None
+        if token is None or token.type != TokenType.LITERAL or \
+                token.start + token.s.index(quote) != pos.offset or \
+                token.end > self.end_offset:
+            raise ValueError(f'No string end found for quote char at {pos}')
+        return self.pos_at(token.end - 1)
+
+    def strip(self, allow_empty: bool = False) -> 'Chunk':
+        """
+        Gets Chunk with whitespace removed from both of its ends.
+
+        The bounds of the stripped Chunk are found by stepping over
+        whitespace chars of the source text, without copying the
+        content of the Chunk.
+
+        :param allow_empty: If True, an empty Chunk is returned if the
+                    Chunk contains only whitespace.
+        :return: Chunk
+        :raises ValueError if the Chunk contains only whitespace and
+                    allow_empty is False.
+        """
+        text = self._text
+        start, end = self.start_offset, self.end_offset
+        while start < end and text[start] in string.whitespace:
+            start += 1
+        if start == end and not allow_empty:
             raise ValueError(f'No non-whitespace content in {self}')
-        end = len(self) - 1
-        while self[end] in string.whitespace:
+        while end > start and text[end - 1] in string.whitespace:
             end -= 1
-        return self[start:end + 1]
+        return self.span(start, end)
+
+    def update_hash(self, update: ty.Callable[[bytes], None]) -> None:
+        """
+        Feeds the encoded content of the Chunk to a hasher.
+
+        Only the span of the Chunk is encoded, and the encoding is not
+        kept, so that no encoded copy of the whole source text is held
+        for as long as the SourceContent lives.
+
+        :param update: update method of a hasher.
+        :return: None
+        """
+        update(self._text[self.start_offset:self.end_offset].encode())
 
     @property
     def index_range(self) -> range:
@@ -1160,49 +2482,52 @@ class Chunk:
         Range of valid int indices in chunk.
         :return: range
         """
-        if self._index_range is None:
-            # populate sorted dict?
-            assert isinstance(self.start, SourcePos)
-            assert isinstance(self.end, SourcePos)
-            size_sum = sum(len(line.s(self.form)) for line in self.lines)
-            size_sum -= self.start.col_i
-            size_sum -= \
-                len(self.file_content.lines[self.end.line_i].s(self.form)) - \
-                self.end.col_i
-            self._index_range = range(size_sum)
-        assert isinstance(self._index_range, range)
-        return self._index_range
+        return range(len(self))
 
     @property
     def lines(self) -> 'Lines':
         return self.Lines(self)
 
     @property
-    def content_hash(self) -> int:
+    def first_line(self) -> 'Line':
+        return self.file_content.lines[self.start.line_i]
+
+    @property
+    def last_line(self) -> 'Line':
+        return self.file_content.lines[self.end.line_i]
+
+    @property
+    def content_hash(self) -> bytes:
         """
         Hashes content of Chunk.
-        :return: hash int
-        :rtype int
+        Only lines terminated by a newline within the Chunk
+        are hashed.
+        :return: hash bytes
+        :rtype bytes
         """
-        return iter_hash((s[:-1] if s.endswith('\n') else s)
-                         for s in self.line_strings)
+        start = self.start_offset
+        end = max(self._text.rfind('\n', start, self.end_offset) + 1, start)
+        return iter_hash([self.span(start, end)])
 
     @property
-    def line_strings(self):
-        line_s = ''
-        for c in self:
-            line_s += c
-            if c == '\n':
-                yield line_s
-                line_s = ''
+    def line_strings(self) -> ty.Iterable[str]:
+        """
+        Yields each newline-terminated line of the Chunk's content.
+        Trailing content that is not followed by a newline is omitted.
+        :return: str iterable.
+        """
+        for line_s in str(self).split('\n')[:-1]:
+            yield line_s + '\n'
 
     @property
     def start(self) -> 'SourcePos':
-        return self._start
+        return SourcePos.from_offset(
+            self.file_content, self.start_offset, self.form)
 
     @property
     def end(self) -> 'SourcePos':
-        return self._end
+        return SourcePos.from_offset(
+            self.file_content, self.end_offset, self.form)
 
     @property
     def bounds_description(self) -> str:
@@ -1215,20 +2540,36 @@ class Chunk:
     def _slice(self, chunk_slice: slice):
         if chunk_slice.step:
             raise ValueError('Chunk cannot be sliced using step argument.')
-        start = chunk_slice.start or self.start
-        if chunk_slice.stop is not None:
-            stop = chunk_slice.stop
-        else:
-            stop = self.end
-        if isinstance(start, int):
-            if start < 0:
-                start += len(self)
-            start = self.start + start
-        if isinstance(stop, int):
-            if stop < 0:
-                stop += len(self)
-            stop = self.start + stop
-        return Chunk(self.file_content, start, stop)
+        start = self._slice_offset(chunk_slice.start, self.start_offset)
+        stop = self._slice_offset(chunk_slice.stop, self.end_offset)
+        chunk = self.span(start, stop)
+        chunk._check_bounds()
+        return chunk
+
+    def _slice_offset(
+            self,
+            i: ty.Union[None, int, 'SourcePos'],
+            default: int
+    ) -> int:
+        """
+        Gets the offset within the source text of a bound of a slice.
+
+        :param i: index relative to start of Chunk, SourcePos, or None.
+        :param default: offset used if i is None.
+        :return: int offset.
+        :raises ValueError if an index lies outside the source text.
+        """
+        if i is None:
+            return default
+        if isinstance(i, SourcePos):
+            return i.offset
+        if i < 0:
+            i += len(self)
+        offset = self.start_offset + i
+        if not 0 <= offset <= len(self._text):
+            raise ValueError(
+                f'Cannot add {i} to {self.start}. {i} is too large.')
+        return offset
 
     def _char_at_pos(self, pos: 'SourcePos') -> str:
         """
@@ -1239,19 +2580,10 @@ class Chunk:
         :rtype: str
         :raises IndexError if SourcePos outside Chunk.
         """
-        if not self.start.line_i <= pos.line_i <= self.end.line_i:
+        if not self.start_offset <= pos.offset < self.end_offset:
             raise IndexError(
-                f'Line index {pos.line_i} outside chunk lines: '
-                f'{self.start.line_i} to {self.end.line_i}')
-        if pos.line_i == self.start.line_i and pos.col_i < self.start.col_i:
-            raise IndexError(
-                f'Column index {pos.col_i} precedes chunk start index: '
-                f'{self.start.col_i}')
-        if pos.line_i == self.end.line_i and pos.col_i >= self.end.col_i:
-            raise IndexError(
-                f'Column index {pos.col_i} does not precede chunk end '
-                f'index: {self.end.col_i}')
-        return self.file_content.lines[pos.line_i].s(self.form)[pos.col_i]
+                f'{pos} is outside chunk: {self.bounds_description}')
+        return self._text[pos.offset]
 
     def _char_at_index(self, i: int) -> str:
         """
@@ -1265,48 +2597,18 @@ class Chunk:
         """
         if i < 0:
             i += len(self)
-        if i not in self.index_range:
+        if not 0 <= i < len(self):
             raise IndexError(
                 f'Index: {i} is outside valid range. '
                 f'Chunk has len: {len(self)}')
-        # Use sorted dict to accelerate line lookup?
-        assert isinstance(self.start, SourcePos)
-        search_i = 0
-        for line in self.lines:
-            usable_len = len(line.s(self.form))
-            if line == self.first_line:
-                usable_len -= self.start.col_i
-            if search_i + usable_len > i:
-                containing_line = line
-                relative_col = i - search_i
-                break
-            search_i += usable_len
-        else:
-            raise RuntimeError('This should not be reached.')
-        if containing_line is self.lines[0]:
-            line_col = relative_col + self.start.col_i
-        else:
-            line_col = relative_col
-        return containing_line.s(self.form)[line_col]
+        return self._text[self.start_offset + i]
 
     def __str__(self):
         """
         Gets str content of chunk.
         :return: str
         """
-        s = ''
-        if self.first_line is self.last_line:
-            line_s = self.first_line.s(self.form)
-            return line_s[self.start.col_i:self.end.col_i]
-        for line in self.lines:
-            line_s = line.s(self.form)
-            if line is self.first_line:
-                s += line_s[self.start.col_i:]
-            elif line is self.last_line:
-                s += line_s[:self.end.col_i]
-            else:
-                s += line_s
-        return s
+        return self._text[self.start_offset:self.end_offset]
 
     def __repr__(self) -> str:
         return f'Chunk[s: {str(self)}]'
@@ -1354,40 +2656,97 @@ class Chunk:
                 yield self.chunk.file_content.lines[i]
 
 
-def join_hashes(hash_iterable: ty.Iterable[int]) -> int:
+class TokenType(enum.Enum):
+    PREPROCESSOR = 1
+    LITERAL = 2
+    NUMBER = 3
+    IDENTIFIER = 4
+    BRACKET = 5
+    PUNCTUATION = 6
+
+
+class Token:
+    """
+    Lexical unit of source code, such as an identifier, literal, or
+    punctuation mark, along with its offsets within source text.
+    """
+
+    def __init__(self, token_type: 'TokenType', s: str, start: int) -> None:
+        self.type = token_type
+        self.s = s
+        self.start = start
+        self.end = start + len(s)
+
+    def __repr__(self) -> str:
+        return f'Token[{self.type.name}, {repr(self.s)}, {self.start}]'
+
+
+def lex(text: str) -> ty.List['Token']:
+    """
+    Splits passed source text into Tokens in a single pass.
+
+    Whitespace is discarded. Each preprocessor directive, including
+    any continuation lines, is produced as a single token.
+
+    :param text: str of source, typically in STRIPPED form.
+    :return: List of Tokens, ordered by offset.
+    :rtype: List[Token]
+    """
+    types = {token_type.name.lower(): token_type for token_type in TokenType}
+    return [Token(types[match.lastgroup], match.group(), match.start())
+            for match in TOKEN_PATTERN.finditer(text)]
+
+
+def join_hashes(hash_iterable: ty.Iterable[bytes]) -> bytes:
     """
     Join hashes of the passed iterable.
-    :param hash_iterable: Iterable[int]
-    :return: int
+
+    As each hash has the same width, the hashes are fed to a single
+    hasher one after another, without being separated.
+    :param hash_iterable: Iterable of hashes produced by iter_hash
+                or join_hashes.
+    :return: bytes hash of HASH_SIZE.
     """
-    prime = 31
-    result: int = 1
+    hasher = hashlib.blake2b(digest_size=HASH_SIZE)
     for sub_hash in hash_iterable:
-        result = (result * prime + sub_hash) % sys.maxsize
-    return result
+        hasher.update(sub_hash)
+    return hasher.digest()
 
 
-def iter_hash(gen: ty.Iterable[str], accept_none: bool = False) -> int:
+def iter_hash(
+        gen: ty.Iterable[ty.Union[str, 'Chunk']],
+        accept_none: bool = False
+) -> bytes:
     """
     Hashes content of iterable.
 
-    Intended to be used to parse line content.
+    Intended to be used to parse line content. Each str is fed to a
+    single hasher, followed by a NUL separator, so that no digest is
+    produced for each str. The content of each Chunk is fed as it
+    would be as a str, by encoding only the span it covers.
 
-    :param gen: Iterable[Hashable]
-    :param accept_none: If true, throws ValueError if None is received.
-    :return: int hash whose absolute value is < system max-size.
-    :rtype: int
+    :param gen: Iterable of str or Chunk
+    :param accept_none: If true, None is hashed as a distinct value.
+                Otherwise, ValueError is raised if None is received.
+    :return: bytes hash of HASH_SIZE.
+    :rtype: bytes
     :raises ValueError if None is received and accept_none is False.
     """
-    def hash_generator():
-        for s in gen:
-            if not accept_none and s is None:
+    hasher = hashlib.blake2b(digest_size=HASH_SIZE)
+    update = hasher.update
+    for s in gen:
+        if s is None:
+            if not accept_none:
                 raise ValueError(
                     'None received. Enable accept_none if this is expected.')
-            yield int(hashlib.md5(s.encode()).hexdigest(), 16)
-    result = join_hashes(hash_generator())
-    assert isinstance(result, int)
-    return result
+            update(b'\1\0')
+        elif isinstance(s, Chunk):
+            s.update_hash(update)
+            update(b'\0')
+        else:
+            update(s.encode())
+            update(b'\0')
+    return hasher.digest()
 
 
 #######################################################################
@@ -1429,6 +2788,9 @@ class Component:
             self.chunk = Chunk(file_content, start, end).strip()
         self._tokens: ty.Optional[ty.Set[str]] = None
         self._tags: ty.Optional[ty.Set[str]] = None
+        self._content_hash: ty.Optional[bytes] = None
+        self._reference_hash: ty.Optional[bytes] = None
+        self._exposed_hash: ty.Optional[bytes] = None
 
     @classmethod
     def create(
@@ -1438,41 +2800,43 @@ class Component:
     ) -> 'Component':
         """
         Creates a Component from a passed position in source.
+
+        The component is classified by walking the tokens in the
+        top level scope of the chunk. Bracketed content is skipped,
+        and is represented in the walked signature by an empty
+        bracket pair, ie: '()'.
         :return: Component
         """
         # This method should be broken up.
-        s = ''
-        pos = chunk.start
+        signature: ty.List[str] = []
+        names: ty.Set[str] = set()
         component: ty.Optional['Component'] = None
-        while True:
-            try:
-                c = chunk[pos]
-            except IndexError:
-                raise ComponentCreationError('End of block reached.')
+        for token, close in chunk.scope_token_stream(
+                angle_brackets=scope != ScopeType.FUNC):
+            c = token.s
             # Check for label
             # Consider component to be a label when a single ':'
-            # appears in s, that is not a class extension or beginning
+            # is found, that is not a class extension or beginning
             # of an initialization.
-            if all(('class' not in s,
-                    '()' not in s,
-                    c != ':',
-                    s.endswith(':'),
-                    not s.endswith('::'))):
-                component = Label(chunk[:pos])
+            if all((c == ':',
+                    'class' not in names,
+                    '()' not in signature,
+                    token.end < chunk.end_offset)):
+                component = Label(chunk[:chunk.pos_at(token.end)])
                 break
             # Check for statement
             if c == ';':
-                s += c
-                component_chunk = chunk[:pos + 1]
+                signature.append(c)
+                component_chunk = chunk[:chunk.pos_at(token.end)]
                 if scope == ScopeType.FUNC:
                     component = MiscStatement(component_chunk)
                 else:
-                    if 'class' in s:
+                    if 'class' in names:
                         component = CppClassForwardDeclaration(component_chunk)
-                    elif 'using' in s:
+                    elif 'using' in names:
                         component = UsingStatement.create(
                             component_chunk, scope)
-                    elif '()' in s:
+                    elif '()' in signature:
                         if scope == ScopeType.GLOBAL:
                             component = FunctionDeclaration(component_chunk)
                         elif scope == ScopeType.CLASS:
@@ -1482,74 +2846,79 @@ class Component:
                         component = MiscStatement(component_chunk)
                 break
             # Check for preprocessor directive
-            elif pos.col_i == 0 and chunk.line(pos).stripped.startswith('#'):
-                component = PreprocessorComponent.create(chunk[pos:])
+            elif token.type == TokenType.PREPROCESSOR:
+                component = PreprocessorComponent.create(
+                    chunk[chunk.pos_at(token.start):])
                 break
-            elif c in string.whitespace:
-                pass
-            elif c == '<' and scope != ScopeType.FUNC:
-                # If outside function, '<'
-                pos = chunk.find_pair(pos)
-                s += '<>'  # Leave out template internals.
-            elif c == '(':
-                pos = chunk.find_pair(pos)
-                s += '()'  # Leave out argument internals.
-            elif c == '[':
-                pos = chunk.find_pair(pos)
-                s += '[]'  # Leave out capture internals.
-            elif c == '{':
-                # Check if brackets are a control block
-                prefix_tokens = set(scope_tokens(chunk[:pos]))
-                pos = chunk.find_pair(pos)
-                if 'namespace' in s:
-                    component = NamespaceComponent(chunk[:pos + 1])
+            elif close is None:
+                signature.append(c)
+                if token.type == TokenType.IDENTIFIER:
+                    names.add(c)
+            elif c != '{':
+                # Leave out template, argument, and capture internals.
+                signature.append(c + BRACKETS[c])
+            else:
+                if 'namespace' in names:
+                    component = NamespaceComponent(
+                        chunk[:chunk.pos_at(close + 1)])
                     break
-                if 'class' in s:
+                if 'class' in names:
                     # Ensure class definition is followed by
                     # a semi-colon.
-                    for trailing_c in chunk[pos + 1:]:
-                        pos += 1
-                        if trailing_c == ';':
-                            break
-                        if trailing_c not in string.whitespace:
-                            raise ParsingException(
-                                'Class definition seems to be missing'
-                                f'semi-colon in {chunk[:pos]}. Unexpected '
-                                'character found after class: '
-                                f'{repr(trailing_c)}'
-                            )
-                    else:
-                        raise ParsingException(
-                            'No semi-colon found after class in '
-                            f'{chunk[:pos]}')
-                    component = CppClassDefinition(chunk[:pos + 1])
+                    end = cls._find_class_end(chunk, close)
+                    component = CppClassDefinition(chunk[:chunk.pos_at(end)])
                     break
-                if s.endswith('()'):  # Function
-                    if any(kw in prefix_tokens for
-                           kw in ControlBlock.KEYWORDS):
-                        component = ControlBlock(chunk[:pos + 1])
-                    elif scope == ScopeType.FUNC and '[]' not in s:
+                if signature and signature[-1] == '()':  # Function
+                    if any(kw in names for kw in ControlBlock.KEYWORDS):
+                        component = ControlBlock(
+                            chunk[:chunk.pos_at(close + 1)])
+                    elif scope == ScopeType.FUNC and '[]' not in signature:
                         raise ParsingException(
                             'Seemed to find function definition within'
                             'another function definition in '
-                            f'{chunk[:pos + 1]}')
+                            f'{chunk[:chunk.pos_at(close + 1)]}')
                     elif scope == ScopeType.GLOBAL:
-                        component = FunctionDefinition(chunk[:pos + 1])
+                        component = FunctionDefinition(
+                            chunk[:chunk.pos_at(close + 1)])
                     elif scope == ScopeType.CLASS:
-                        component = MemberFunctionDefinition(chunk[:pos + 1])
+                        component = MemberFunctionDefinition(
+                            chunk[:chunk.pos_at(close + 1)])
                     break
                 # Other occurrences of curly brackets are ignored.
-            else:
-                s += c
-            try:
-                pos += 1
-            except ValueError:
-                break
         if not component:
             raise ComponentCreationError(f'No component found in {chunk}')
         return component
 
-    @property
+    @staticmethod
+    def _find_class_end(chunk: 'Chunk', close: int) -> int:
+        """
+        Finds end of a class definition, which is expected to be
+        a semi-colon following the closing bracket of the class block.
+
+        :param chunk: Chunk containing class definition.
+        :param close: int offset of closing bracket of class block.
+        :return: int offset following semi-colon.
+        :rtype: int
+        :raises ParsingException if no semi-colon follows the class.
+        """
+        text = chunk.file_content.text(chunk.form)
+        i = close + 1
+        end = chunk.end_offset
+        while i < end and text[i] in string.whitespace:
+            i += 1
+        if i == end:
+            raise ParsingException(
+                'No semi-colon found after class in '
+                f'{chunk[:chunk.pos_at(i)]}')
+        if text[i] != ';':
+            raise ParsingException(
+                'Class definition seems to be missing'
+                f'semi-colon in {chunk[:chunk.pos_at(i)]}. Unexpected '
+                f'character found after class: {repr(text[i])}'
+            )
+        return i + 1
+
+    @property
     def tokens(self) -> ty.List[str]:
         if self._tokens is None:
             self._tokens = self._find_tokens()
@@ -1600,9 +2969,104 @@ class Component:
         :return: dict of Constructs.
         :rtype: Dict[str, Construct]
         """
-        return {token: constructs[token] for token in self.tokens
+        used = {token: constructs[token] for token in self.tokens
                 if token in constructs and
                 getattr(self, 'name', None) != token}
+        for component in self.inner_components:
+            used.update(component.used_constructs(constructs))
+        return used
+
+    @property
+    def inner_components(self) -> ty.List['Component']:
+        """
+        Gets components nested within the Component whose used
+        constructs are also used by the Component.
+        :return: List[Component]
+        """
+        return []
+
+    @property
+    def child_components(self) -> ty.List['Component']:
+        """
+        Gets components whose content lies directly within that of
+        the Component.
+        :return: List[Component]
+        """
+        return [getattr(self, attr) for attr in ('block', 'inner_block')
+                if getattr(self, attr, None) is not None]
+
+    @property
+    def content_hash(self) -> bytes:
+        """
+        Gets Merkle hash of the Component's content.
+
+        The hash is composed from the hashes of the child components
+        and from the text of the Component that lies outside of them,
+        so that a change within a child changes the hash of the child
+        and of each of its ancestors, but not of its siblings.
+        :return: bytes
+        """
+        if self._content_hash is None:
+            chunk = self.chunk
+            parts: ty.List[ty.Union[str, 'Chunk']] = [type(self).__name__]
+            pos = chunk.start_offset
+            for child in self.child_components:
+                parts.append(chunk.span(
+                    pos, child.chunk.start_offset).strip(allow_empty=True))
+                pos = child.chunk.end_offset
+            parts.append(
+                chunk.span(pos, chunk.end_offset).strip(allow_empty=True))
+            self._content_hash = join_hashes(itertools.chain(
+                [iter_hash(parts)],
+                (child.content_hash for child in self.child_components)
+            ))
+        return self._content_hash
+
+    @property
+    def reference_hash(self) -> bytes:
+        """
+        Gets Merkle hash of everything which determines the constructs
+        used by the Component: its name, its tokens, and those of its
+        inner components.
+
+        Only the first occurrence of each token is included, as only
+        that determines the order in which constructs are used, and
+        numbers are left out, as they cannot name a construct.
+        :return: bytes
+        """
+        if self._reference_hash is None:
+            tokens = dict.fromkeys(
+                token for token in self.tokens if not token[0].isdigit())
+            self._reference_hash = join_hashes(itertools.chain(
+                [iter_hash(itertools.chain(
+                    [getattr(self, 'name', '')], tokens))],
+                (component.reference_hash
+                 for component in self.inner_components)
+            ))
+        return self._reference_hash
+
+    @property
+    def exposed_hash(self) -> bytes:
+        """
+        Gets Merkle hash of everything that the Component and its
+        sub-components contribute to the used content of an object,
+        other than through the content of constructs.
+
+        This includes exposed content, and the constructs which are
+        used, but not the content of those constructs.
+        :return: bytes
+        """
+        if self._exposed_hash is None:
+            self._exposed_hash = join_hashes(itertools.chain(
+                [iter_hash(itertools.chain(
+                    [type(self).__name__],
+                    (chunk.strip(allow_empty=True)
+                     for chunk in self.exposed_content)
+                )), self.reference_hash],
+                (component.exposed_hash
+                 for component in self.sub_components)
+            ))
+        return self._exposed_hash
 
     @property
     def construct_content(self) -> ty.Dict[str, ty.List['Component']]:
@@ -1645,6 +3109,83 @@ class Component:
         """
         return self.chunk.tokenize()
 
+    def skeleton(self) -> ty.Dict[str, ty.Any]:
+        """
+        Produces a JSON serializable description of the Component and
+        all components nested within it, from which the Component can
+        be restored without parsing its source.
+
+        Produces the full component tree, so any components which
+        have not yet been parsed will be parsed.
+
+        :return: dict describing Component.
+        :rtype: Dict[str, Any]
+        """
+        skeleton: ty.Dict[str, ty.Any] = {
+            'type': type(self).__name__,
+            'start': self.chunk.start_offset,
+            'end': self.chunk.end_offset,
+            'tokens': self.tokens,
+        }
+        name = getattr(self, 'name', None)
+        if name is not None:
+            skeleton['name'] = name
+        for attr in ('block', 'inner_block'):
+            block = getattr(self, attr, None)
+            if block is not None:
+                skeleton[attr] = block.skeleton()
+        return skeleton
+
+    @classmethod
+    def from_skeleton(
+            cls,
+            file_content: 'SourceContent',
+            skeleton: ty.Dict[str, ty.Any]
+    ) -> 'Component':
+        """
+        Restores a Component previously described by
+        Component.skeleton(), without parsing source.
+
+        :param file_content: SourceContent for file that
+                    contains Component.
+        :param skeleton: dict describing Component.
+        :return: Component
+        :rtype: Component
+        """
+        component_type = COMPONENT_TYPES[skeleton['type']]
+        component = component_type.__new__(component_type)
+        component._restore(file_content, skeleton)
+        return component
+
+    def _restore(
+            self,
+            file_content: 'SourceContent',
+            skeleton: ty.Dict[str, ty.Any]
+    ) -> None:
+        """
+        Sets attributes of a Component created by from_skeleton().
+        May be extended in subclasses which store additional data.
+
+        :param file_content: SourceContent for file that
+                    contains Component.
+        :param skeleton: dict describing Component.
+        :return: None
+        """
+        self.chunk = Chunk.from_offsets(
+            file_content, skeleton['start'], skeleton['end'])
+        self._tokens = [sys.intern(token) for token in skeleton['tokens']]
+        self._tags = None
+        self._content_hash = None
+        self._reference_hash = None
+        self._exposed_hash = None
+        if 'name' in skeleton:
+            self.name = sys.intern(skeleton['name'])
+        for attr in ('block', 'inner_block'):
+            if attr in skeleton:
+                block = Component.from_skeleton(file_content, skeleton[attr])
+                setattr(self, attr, block)
+                self.prefix = self.chunk[:block.chunk.start]
+
 
 class Block(Component):
     """
@@ -1685,6 +3226,29 @@ class Block(Component):
                     pos = component.chunk.end
         return self._sub_components
 
+    @property
+    def child_components(self) -> ty.List['Component']:
+        return self.sub_components
+
+    def skeleton(self) -> ty.Dict[str, ty.Any]:
+        skeleton = super().skeleton()
+        skeleton['scope_type'] = self.scope_type.name
+        skeleton['sub_components'] = [
+            component.skeleton() for component in self.sub_components]
+        return skeleton
+
+    def _restore(
+            self,
+            file_content: 'SourceContent',
+            skeleton: ty.Dict[str, ty.Any]
+    ) -> None:
+        super()._restore(file_content, skeleton)
+        self.scope_type = ScopeType[skeleton['scope_type']]
+        self._sub_components = [
+            Component.from_skeleton(file_content, sub_skeleton)
+            for sub_skeleton in skeleton['sub_components']
+        ]
+
     def __repr__(self) -> str:
         return f'Block[{self.chunk.bounds_description}]'
 
@@ -1786,10 +3350,15 @@ class FunctionDeclaration(Component):
     declared, and so the effect should be the same.
     """
 
-    @property
-    def name(self) -> str:
+    def __init__(
+            self,
+            file_content: ty.Union['SourceContent', 'Chunk'],
+            start: 'SourcePos' = None,
+            end: ty.Optional['SourcePos'] = None
+    ) -> None:
+        super().__init__(file_content, start, end)
         first_parenthesis = find_in_scope('(', self.chunk)
-        return scope_tokens(self.chunk[:first_parenthesis])[-1]
+        self.name = scope_tokens(self.chunk[:first_parenthesis])[-1]
 
     @property
     def construct_content(self) -> ty.Dict[str, ty.List['Component']]:
@@ -1858,14 +3427,9 @@ class FunctionDefinition(Component):
         block_start = find_in_scope('{', self.chunk)
         return Block(self.chunk[block_start:], scope_type=ScopeType.FUNC)
 
-    def used_constructs(
-            self,
-            constructs: ty.Dict[str, 'Construct']
-    ) -> ty.Dict[str, 'Construct']:
-        used: ty.Dict[str, 'Construct'] = super().used_constructs(constructs)
-        for component in self.inner_block.sub_components:
-            used.update(component.used_constructs(constructs))
-        return used
+    @property
+    def inner_components(self) -> ty.List['Component']:
+        return self.inner_block.sub_components
 
     @property
     def construct_content(self) -> ty.Dict[str, ty.List['Component']]:
@@ -1930,14 +3494,9 @@ class CppClassDefinition(Component):
         prefix_tokens = scope_tokens(self.prefix)
         return prefix_tokens[prefix_tokens.index('class') + 1]
 
-    def used_constructs(
-            self,
-            constructs: ty.Dict[str, 'Construct']
-    ) -> ty.Dict[str, 'Construct']:
-        used: ty.Dict[str, 'Construct'] = super().used_constructs(constructs)
-        for component in self.member_components:
-            used.update(component.used_constructs(constructs))
-        return used
+    @property
+    def inner_components(self) -> ty.List['Component']:
+        return self.member_components
 
     @property
     def construct_content(self) -> ty.Dict[str, ty.List['Component']]:
@@ -2012,6 +3571,25 @@ class UsingStatement(Component):
         return UsingStatement(chunk)
 
 
+COMPONENT_TYPES: ty.Dict[str, ty.Type['Component']] = {
+    component_type.__name__: component_type for component_type in (
+        Block,
+        NamespaceComponent,
+        PreprocessorComponent,
+        MiscStatement,
+        FunctionDeclaration,
+        MemberFunctionDeclaration,
+        CppClassForwardDeclaration,
+        FunctionDefinition,
+        MemberFunctionDefinition,
+        CppClassDefinition,
+        Label,
+        ControlBlock,
+        UsingStatement,
+    )
+}
+
+
 def find_in_scope(sub_str: str, chunk: 'Chunk') -> 'SourcePos':
     """
     Finds passed sub_str within the scope that begins at the start of
@@ -2026,29 +3604,25 @@ def find_in_scope(sub_str: str, chunk: 'Chunk') -> 'SourcePos':
     :return: SourcePos indicating start of passed sub_str in chunk.
     :rtype: SourcePos
     """
-    s = ''
-    pos = chunk.start
-    while True:
-        if s.endswith(sub_str):
-            return pos - len(sub_str)
-        try:
-            c = chunk[pos]
-        except IndexError:
-            raise KeyError(f'{sub_str} not found in {chunk}')
-        if (c in BRACKETS or c in '\'"') and (s + c).endswith(sub_str):
-            return pos - (len(sub_str) - 1)
-        if c in BRACKETS:
-            pos = chunk.find_pair(pos)
-            s = BRACKETS[c]
-        elif c in '\'"':
-            pos = chunk.find_quote_end(pos)
-            s = c
-        else:
-            s += c
-        pos += 1
-
-
-def scope_tokens(chunk: 'Chunk', regex: str = r"[\w0-9]+") -> ty.List[str]:
+    text = chunk.file_content.text(chunk.form)
+    # Search each run of text between bracketed or quoted content.
+    # A run may end with the opening char of such content, and begins
+    # with the closing char of the previous bracket or quote.
+    run_start = chunk.start_offset
+    for token, close in chunk.scope_token_stream():
+        if close is None and token.type != TokenType.LITERAL:
+            continue
+        i = text.find(sub_str, run_start, token.start + 1)
+        if i != -1:
+            return chunk.pos_at(i)
+        run_start = close if close is not None else token.end - 1
+    i = text.find(sub_str, run_start, chunk.end_offset)
+    if i != -1:
+        return chunk.pos_at(i)
+    raise KeyError(f'{sub_str} not found in {chunk}')
+
+
+def scope_tokens(chunk: 'Chunk', regex: str = WORD_REGEX) -> ty.List[str]:
     """
     Gets tokens in the highest level scope of the passed chunk.
     Passed chunk should begin within the scope that tokens
@@ -2060,20 +3634,15 @@ def scope_tokens(chunk: 'Chunk', regex: str = r"[\w0-9]+") -> ty.List[str]:
     :param regex: Optional regex to use for finding tokens.
     :return: List[str]
     """
-    s = ''
-    pos = chunk.start
-    while pos != chunk.end:
-        c = chunk[pos]
-        if c in BRACKETS:
-            pos = chunk.find_pair(pos)
-        elif c in '\'"':
-            pos = chunk.find_quote_end(pos)
-        else:
-            s += c
-        try:
-            pos += 1
-        except ValueError:
-            break
+    if regex == WORD_REGEX:
+        content = chunk.file_content
+        words: ty.List[str] = []
+        for token, close in chunk.scope_token_stream():
+            if close is None and token.type != TokenType.LITERAL:
+                words += content.words(token.start, token.end, chunk.form)
+        return words
+    s = ' '.join(token.s for token, close in chunk.scope_token_stream()
+                 if close is None and token.type != TokenType.LITERAL)
     return re.findall(regex, s)
 
 
@@ -2122,26 +3691,1219 @@ def parse_tags(s: str) -> ty.Set[str]:
 
 class Construct:
     """
+    Named construct, such as a class or function, along with the
+    components which provide its content.
+
+    Constructs are immutable, so that they may be shared between the
+    construct tables of every CompileObject using the same source.
+    """
+    def __init__(
+            self,
+            name: str,
+            content: ty.Iterable['Component'] = ()
+    ) -> None:
+        self.name = name
+        self.content: ty.Tuple['Component', ...] = tuple(content)
+
+    def merge(self, other: 'Construct') -> 'Construct':
+        """
+        Creates a construct with the content of this construct
+        followed by the content of another.
+        :param other: Construct with the same name.
+        :return: new Construct
+        :rtype: Construct
+        """
+        return Construct(self.name, self.content + other.content)
+
+    def __repr__(self) -> str:
+        return f'Construct[{self.name}, {len(self.content)} components]'
+
+
+class SourceTree(ty.NamedTuple):
+    """
+    Merkle hashes of the component tree of a source's content, from
+    which the constructs changed between two versions of the content
+    can be found without comparing the components themselves.
+    """
+    root: bytes  # content hash of the content's Block.
+    exposed: bytes  # joined exposed hashes of top level components.
+    constructs: ty.Dict[str, bytes]  # joined content hashes by name.
+
+    def changed_constructs(
+            self,
+            old: 'SourceTree'
+    ) -> ty.Optional[ty.Set[str]]:
+        """
+        Finds the constructs whose content differs from that of an
+        older tree, including constructs that were removed.
+
+        :param old: SourceTree of an older version of the content.
+        :return: Set of names of changed constructs, or None if any
+                    user of the content may be affected: if the content
+                    exposed regardless of the constructs that are used
+                    has changed, or if constructs have been added,
+                    which may be used by any content naming them.
+        :rtype: Optional[Set[str]]
+        """
+        if self.root == old.root:
+            return set()
+        if self.exposed != old.exposed or \
+                not self.constructs.keys() <= old.constructs.keys():
+            return None
+        return {name for name, old_hash in old.constructs.items()
+                if self.constructs.get(name) != old_hash}
+
+
+#######################################################################
+# Caching
+
+
+class FileStat(ty.NamedTuple):
+    """
+    Stat information of a file that is used to detect changes.
+    """
+    m_time: int  # nanoseconds since epoch.
+    size: int
+    inode: int
+
+    @classmethod
+    def of(cls, path: ty.Union[str, Path]) -> 'FileStat':
+        """
+        Stats the file at the passed path.
+        :param path: path to file.
+        :return: FileStat
+        :raises FileNotFoundError if file does not exist.
+        """
+        return cls.from_stat_result(os.stat(str(path)))
+
+    @classmethod
+    def from_stat_result(cls, result: os.stat_result) -> 'FileStat':
+        return cls(result.st_mtime_ns, result.st_size, result.st_ino)
+
+
+class StatCache:
+    """
+    Cache of file stats that lasts for a single run.
+
+    Each path is stat'ed at most once until it is invalidated, so that
+    files shared by many objects, such as common headers, are not
+    repeatedly stat'ed. Files which do not exist are cached as well.
+    """
+
+    def __init__(self) -> None:
+        self._stats: ty.Dict[str, ty.Optional['FileStat']] = {}
+
+    def stat(self, path: ty.Union[str, Path]) -> 'FileStat':
+        """
+        Gets the stat of the file at the passed path.
+        :param path: path to file.
+        :return: FileStat
+        :raises FileNotFoundError if file does not exist.
+        """
+        key = os.path.abspath(str(path))
+        try:
+            result = self._stats[key]
+        except KeyError:
+            try:
+                result = FileStat.of(key)
+            except FileNotFoundError:
+                result = None
+            self._stats[key] = result
+        if result is None:
+            raise FileNotFoundError(f'No such file: {key}')
+        return result
+
+    def prefetch(self, paths: ty.Iterable[ty.Union[str, Path]]) -> None:
+        """
+        Stats each of the passed paths that is not already cached.
+
+        Each path is stat'ed individually rather than by scanning its
+        directory, as on Linux a scan would not save any stat calls:
+        each entry still needs its own stat for its nanosecond m_time.
+        A path that cannot be stat'ed, such as a broken symlink, is
+        cached as missing without affecting the other paths.
+
+        :param paths: paths to files.
+        :return: None
+        """
+        for path in paths:
+            key = os.path.abspath(str(path))
+            if key in self._stats:
+                continue
+            try:
+                self._stats[key] = FileStat.of(key)
+            except FileNotFoundError:
+                self._stats[key] = None
+
+    def invalidate(self, path: ty.Union[str, Path, None] = None) -> None:
+        """
+        Removes the stat of the passed path from the cache, so that it
+        is stat'ed again when next needed.
+        :param path: path to file. If None, all stats are removed.
+        :return: None
+        """
+        if path is None:
+            self._stats.clear()
+        else:
+            self._stats.pop(os.path.abspath(str(path)), None)
+
+    def __repr__(self) -> str:
+        return f'StatCache[{len(self._stats)} paths]'
+
+
+class ParseCache:
+    """
+    Persistent cache of parsed component trees.
+
+    Each entry stores the skeleton of the component tree of a single
+    file's content, keyed by a hash of that content, so that the
+    components of unchanged files can be restored rather than parsed.
+
+    Entries are stored as separate files within the cache directory.
+    Loading an entry marks it as recently used, and once the directory
+    exceeds its maximum size, the least recently used entries
+    are evicted.
+    """
+
+    DIR_NAME = 'zen_parse_cache'
+    VERSION = 3  # Changed whenever parsing produces different trees.
+    MAX_SIZE = 256 * 1024 * 1024  # bytes
+
+    def __init__(self, path: Path, max_size: int = MAX_SIZE) -> None:
+        """
+        Initializes a new parse cache handler.
+        :param path: path to cache directory.
+        :param max_size: maximum size in bytes of all cache entries.
+        """
+        self.path = path
+        self.max_size = max_size
+
+    def load(
+            self,
+            content: 'SourceContent'
+    ) -> ty.Optional['Block']:
+        """
+        Restores the component tree of the passed content from cache.
+
+        :param content: SourceContent whose components are to
+                    be restored.
+        :return: Block containing restored components, or None if
+                    no valid entry exists for the content.
+        :rtype: Optional[Block]
+        """
+        entry_path = self._entry_path(content.digest)
+        try:
+            with entry_path.open() as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry.get('version') != self.VERSION:
+            return None
+        os.utime(entry_path)  # Mark entry as recently used.
+        block = Component.from_skeleton(content, entry['component'])
+        assert isinstance(block, Block)
+        return block
+
+    def store(self, content: 'SourceContent', block: 'Block') -> None:
+        """
+        Stores the component tree of the passed content.
+
+        If any part of the tree cannot be parsed, nothing is stored,
+        leaving the error to be raised when that part is used.
+
+        :param content: SourceContent that components belong to.
+        :param block: Block containing all of the content's components.
+        :return: None
+        """
+        try:
+            skeleton = block.skeleton()
+        except (ParsingException, ValueError, KeyError, IndexError):
+            verbose(f'Not caching components of {content}; parse failed.')
+            return
+        self.path.mkdir(exist_ok=True)
+        entry_path = self._entry_path(content.digest)
+        temp_path = entry_path.with_suffix(f'.{os.getpid()}.tmp')
+        with temp_path.open('w') as f:
+            json.dump({'version': self.VERSION, 'component': skeleton}, f)
+        os.replace(str(temp_path), str(entry_path))
+
+    def evict(self) -> None:
+        """
+        Removes least recently used entries until the total size of
+        the cache does not exceed its maximum size.
+        :return: None
+        """
+        try:
+            dir_entries = os.scandir(str(self.path))
+        except FileNotFoundError:
+            return
+        entries: ty.List[ty.Tuple[float, int, str]] = []
+        with dir_entries:
+            for dir_entry in dir_entries:
+                if dir_entry.name.endswith('.json'):
+                    stat = dir_entry.stat()
+                    entries.append(
+                        (stat.st_mtime, stat.st_size, dir_entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+
+    def _entry_path(self, digest: str) -> Path:
+        return Path(self.path, f'{digest}.json')
+
+    def __repr__(self) -> str:
+        return f'ParseCache[{self.path}]'
+
+
+class CacheTable:
+    """
+    Mapping of source or object hexes to values, within a single
+    table of a HashStore.
+
+    Values are looked up from the store one key at a time as they are
+    needed, and are kept until the store is reloaded. Values that are
+    set or removed are held until the store is committed, so that all
+    changes are written together.
     """
-    def __init__(self, name: str) -> None:
+
+    def __init__(self, store: 'HashStore', name: str) -> None:
+        self.store = store
         self.name = name
-        self.used = False
-        self.content: ty.List['Component'] = []
-        self.tags: ty.Set[str] = set()
+        self._values: ty.Dict[str, ty.Any] = {}
+        self.pending: ty.Dict[str, ty.Any] = {}
+
+    def __getitem__(self, key: str) -> ty.Any:
+        try:
+            value = self._values[key]
+        except KeyError:
+            value = self._values[key] = self.store.lookup(self.name, key)
+        if value is None:
+            raise KeyError(key)
+        return value
 
-    def add_content(self, content: ty.List['Component']) -> None:
+    def __setitem__(self, key: str, value: ty.Any) -> None:
+        assert value is not None
+        self._values[key] = value
+        self.pending[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: str, default: ty.Any = None) -> ty.Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key: str, default: ty.Any = None) -> ty.Any:
         """
-        Adds content chunks to construct.
-        :param content: List[Component]
-        :rtype: None
+        Removes the value of the passed key.
+        :param key: source or object hex.
+        :param default: value returned if the key has no value.
+        :return: removed value, or default.
         """
-        self.content += content
+        value = self.get(key, default)
+        self._values[key] = None
+        self.pending[key] = None
+        return value
 
-    def add_tags(self, tags: ty.Set[str]) -> None:
-        self.tags |= tags
+    def forget(self) -> None:
+        """
+        Discards values that have been looked up, so that they are
+        looked up from the store again when next needed.
+        :return: None
+        """
+        self._values = dict(self.pending)
 
     def __repr__(self) -> str:
-        return f'Construct[{self.name}, used={self.used}]'
+        return f'CacheTable[{self.name}, {self.store}]'
+
+
+class HashStore:
+    """
+    Persistent store of the hashes and stamps of remembered sources
+    and objects.
+
+    Hashes are the stripped hashes of sources and the used content
+    hashes of objects. Stamps are the stats of sources and the
+    modification times of objects, as they were when remembered.
+    Trees are the SourceTrees of headers, and uses are the names of
+    the constructs used by objects from each header. Digests are the
+    hashes of the raw bytes of sources.
+
+    Subclasses implement storage of the tables; changes made through
+    the tables are written by commit. Stores whose version differs
+    from VERSION hold values of another format, and are discarded.
+    """
+
+    TABLES = 'digests', 'hashes', 'stamps', 'trees', 'uses'
+    VERSION = 7
+
+    def __init__(self, dir_path: Path) -> None:
+        """
+        Initializes a new store handler.
+        :param dir_path: path to directory containing the store.
+        """
+        self.dir_path = dir_path
+        self.hashes = CacheTable(self, 'hashes')
+        self.stamps = CacheTable(self, 'stamps')
+        self.trees = CacheTable(self, 'trees')
+        self.uses = CacheTable(self, 'uses')
+        self.digests = CacheTable(self, 'digests')
+
+    @property
+    def path(self) -> Path:
+        """
+        Gets the path of the file that the store is kept in.
+        :return: Path
+        """
+        raise NotImplementedError
+
+    def lookup(self, table: str, key: str) -> ty.Any:
+        """
+        Looks up the stored value of a key.
+        :param table: name of table.
+        :param key: source or object hex.
+        :return: value, or None if the key is not stored.
+        """
+        raise NotImplementedError
+
+    def items(self, table: str) -> ty.Iterator[ty.Tuple[str, ty.Any]]:
+        """
+        Iterates over all stored keys and values of a table, not
+        including uncommitted changes.
+        :param table: name of table.
+        :return: Iterator of (key, value) tuples.
+        """
+        raise NotImplementedError
+
+    def commit(self, live_keys: ty.Optional[ty.Set[str]] = None) -> None:
+        """
+        Writes all pending changes to the store at once.
+
+        :param live_keys: hexes of all current sources and objects.
+                    If passed, entries for other keys are removed.
+        :return: None
+        """
+        changes = {name: getattr(self, name).pending for name in self.TABLES}
+        self._write(changes, live_keys)
+        for name in self.TABLES:
+            getattr(self, name).pending = {}
+
+    def reload(self) -> None:
+        """
+        Discards looked up values if the store has been changed
+        by another process since they were looked up.
+        :return: None
+        """
+        if self._changed():
+            for name in self.TABLES:
+                getattr(self, name).forget()
+
+    def copy_from(self, other: 'HashStore') -> None:
+        """
+        Replaces the content of this store with that of another.
+        :param other: HashStore to copy committed entries from.
+        :return: None
+        """
+        for name in self.TABLES:
+            table = getattr(self, name)
+            for key, value in other.items(name):
+                table[key] = value
+        self.commit({key for name in self.TABLES
+                     for key in getattr(self, name).pending})
+
+    def _write(
+            self,
+            changes: ty.Dict[str, ty.Dict[str, ty.Any]],
+            live_keys: ty.Optional[ty.Set[str]]
+    ) -> None:
+        raise NotImplementedError
+
+    def _changed(self) -> bool:
+        raise NotImplementedError
+
+    @staticmethod
+    def _encode(table: str, value: ty.Any) -> ty.Any:
+        """
+        Converts a value of a table to a JSON serializable form.
+        :param table: name of table.
+        :param value: value of table.
+        :return: JSON serializable value.
+        """
+        if table in ('hashes', 'digests'):
+            return value.hex()
+        if table == 'trees':
+            return [value.root.hex(), value.exposed.hex(),
+                    {name: construct_hash.hex()
+                     for name, construct_hash in value.constructs.items()}]
+        return value
+
+    @staticmethod
+    def _decode(table: str, value: ty.Any) -> ty.Any:
+        """
+        Restores a value of a table converted by _encode.
+        :param table: name of table.
+        :param value: JSON serializable value.
+        :return: value of table.
+        """
+        if table in ('hashes', 'digests'):
+            return bytes.fromhex(value)
+        if table == 'trees':
+            root, exposed, constructs = value
+            return SourceTree(
+                bytes.fromhex(root), bytes.fromhex(exposed),
+                {name: bytes.fromhex(construct_hash)
+                 for name, construct_hash in constructs.items()})
+        return value
+
+    def close(self) -> None:
+        pass
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}[{self.path}]'
+
+
+class JsonHashStore(HashStore):
+    """
+    HashStore which keeps each table in a JSON file.
+
+    Tables are loaded whole when first used, and written whole when
+    committed, along with the version of the store. Used when SQLite
+    is not available, and as the format that stores are exported to.
+    """
+
+    FILE_NAMES = {
+        'hashes': 'zen_cache',
+        'stamps': 'zen_stamps',
+        'trees': 'zen_trees',
+        'uses': 'zen_uses',
+        'digests': 'zen_digests'
+    }
+
+    def __init__(self, dir_path: Path) -> None:
+        super().__init__(dir_path)
+        self._tables: ty.Dict[str, ty.Dict[str, ty.Any]] = {}
+        self._stat: ty.Optional['FileStat'] = None
+
+    @property
+    def path(self) -> Path:
+        return self._table_path('hashes')
+
+    def lookup(self, table: str, key: str) -> ty.Any:
+        value = self._table(table).get(key)
+        return None if value is None else self._decode(table, value)
+
+    def items(self, table: str) -> ty.Iterator[ty.Tuple[str, ty.Any]]:
+        for key, value in self._table(table).items():
+            yield key, self._decode(table, value)
+
+    def _table(self, table: str) -> ty.Dict[str, ty.Any]:
+        try:
+            return self._tables[table]
+        except KeyError:
+            pass
+        try:
+            with self._table_path(table).open() as f:
+                if table == 'hashes':
+                    self._stat = FileStat.from_stat_result(
+                        os.fstat(f.fileno()))
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = {}
+        if isinstance(stored, dict) and stored.get('version') == self.VERSION:
+            values = stored['values']
+        else:
+            if stored:
+                verbose(f'Discarding {table} of {self}; version differs.')
+            values = {}
+        self._tables[table] = values
+        return values
+
+    def _write(
+            self,
+            changes: ty.Dict[str, ty.Dict[str, ty.Any]],
+            live_keys: ty.Optional[ty.Set[str]]
+    ) -> None:
+        # Stamps are written first and digests last, so that an
+        # interrupted write can only leave hashes older than their
+        # stamps, and digests older than their hashes, and not newer.
+        for name in reversed(self.TABLES):
+            values = self._table(name)
+            for key, value in changes[name].items():
+                if value is None:
+                    values.pop(key, None)
+                else:
+                    values[key] = self._encode(name, value)
+            if live_keys is not None:
+                for key in values.keys() - live_keys:
+                    del values[key]
+            path = self._table_path(name)
+            temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+            with temp_path.open('w') as f:
+                json.dump({'version': self.VERSION, 'values': values}, f)
+            os.replace(str(temp_path), str(path))
+        self._stat = FileStat.of(self.path)
+
+    def _changed(self) -> bool:
+        try:
+            stat = FileStat.of(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None and stat == self._stat:
+            return False
+        self._tables.clear()
+        return True
+
+    def _table_path(self, table: str) -> Path:
+        return Path(self.dir_path, self.FILE_NAMES[table])
+
+
+class SqliteHashStore(HashStore):
+    """
+    HashStore kept in an SQLite database.
+
+    Values are looked up by key, so that only the entries of the
+    sources and objects being checked are read, and all changes are
+    written in a single transaction. Hashes and digests are stored as
+    blobs, and other values as JSON.
+
+    The version of the store is kept as the database's user version.
+    If it does not match, the database is recreated; if the database
+    is new, any JSON store in the same directory is imported into it.
+    """
+
+    FILE_NAME = 'zen_cache.db'
+
+    def __init__(self, dir_path: Path) -> None:
+        super().__init__(dir_path)
+        self._connection: ty.Optional['sqlite3.Connection'] = None
+        self._data_version: ty.Optional[int] = None
+
+    @property
+    def path(self) -> Path:
+        return Path(self.dir_path, self.FILE_NAME)
+
+    @property
+    def connection(self) -> 'sqlite3.Connection':
+        """
+        Gets connection to the database, creating the database or
+        updating its schema if needed.
+        :return: sqlite3.Connection
+        """
+        if self._connection is None:
+            connection = sqlite3.connect(
+                str(self.path), timeout=60, check_same_thread=False)
+            try:
+                imported = self._migrate(connection)
+            except BaseException:
+                connection.close()
+                raise
+            self._connection = connection
+            self._data_version = self._current_data_version()
+            if imported is not None:
+                self.copy_from(imported)
+        return self._connection
+
+    def _migrate(
+            self,
+            connection: 'sqlite3.Connection'
+    ) -> ty.Optional['HashStore']:
+        """
+        Creates the tables of the database if its schema version is
+        not current.
+        :param connection: sqlite3.Connection
+        :return: JSON store to import, if the database is new and
+                    one exists.
+        """
+        with connection:
+            version, = connection.execute('PRAGMA user_version').fetchone()
+            if version == self.VERSION:
+                return None
+            for name in self.TABLES:
+                connection.execute(f'DROP TABLE IF EXISTS {name}')
+            for name in ('hashes', 'digests'):
+                connection.execute(
+                    f'CREATE TABLE {name} '
+                    f'(key TEXT PRIMARY KEY, value BLOB NOT NULL) '
+                    f'WITHOUT ROWID')
+            for name in ('stamps', 'trees', 'uses'):
+                connection.execute(
+                    f'CREATE TABLE {name} '
+                    f'(key TEXT PRIMARY KEY, value TEXT NOT NULL) '
+                    f'WITHOUT ROWID')
+            connection.execute(f'PRAGMA user_version = {self.VERSION}')
+        json_store = JsonHashStore(self.dir_path)
+        if version == 0 and json_store.path.exists():
+            verbose(f'Importing {json_store} into {self}')
+            return json_store
+        return None
+
+    def lookup(self, table: str, key: str) -> ty.Any:
+        if not self._exists():
+            return None
+        row = self.connection.execute(
+            f'SELECT value FROM {table} WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return self._load_value(table, row[0])
+
+    def items(self, table: str) -> ty.Iterator[ty.Tuple[str, ty.Any]]:
+        if not self._exists():
+            return
+        for key, value in self.connection.execute(
+                f'SELECT key, value FROM {table}'):
+            yield key, self._load_value(table, value)
+
+    def _write(
+            self,
+            changes: ty.Dict[str, ty.Dict[str, ty.Any]],
+            live_keys: ty.Optional[ty.Set[str]]
+    ) -> None:
+        connection = self.connection
+        with connection:
+            for name in self.TABLES:
+                connection.executemany(
+                    f'INSERT OR REPLACE INTO {name} (key, value) '
+                    f'VALUES (?, ?)',
+                    [(key, self._dump_value(name, value))
+                     for key, value in changes[name].items()
+                     if value is not None])
+                connection.executemany(
+                    f'DELETE FROM {name} WHERE key = ?',
+                    [(key,) for key, value in changes[name].items()
+                     if value is None])
+            if live_keys is not None:
+                self._collect_garbage(connection, live_keys)
+
+    def _collect_garbage(
+            self,
+            connection: 'sqlite3.Connection',
+            live_keys: ty.Set[str]
+    ) -> None:
+        """
+        Removes entries of keys that are not live, if any exist.
+        :param connection: sqlite3.Connection within a transaction.
+        :param live_keys: hexes of all current sources and objects.
+        :return: None
+        """
+        counts = [
+            connection.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+            for name in self.TABLES
+        ]
+        if all(count <= len(live_keys) for count in counts):
+            # Each key is stored at most once per table, so a table
+            # may hold a stale key only if it holds more keys than
+            # are live.
+            return
+        connection.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS live_keys '
+            '(key TEXT PRIMARY KEY) WITHOUT ROWID')
+        connection.execute('DELETE FROM live_keys')
+        connection.executemany(
+            'INSERT INTO live_keys (key) VALUES (?)',
+            [(key,) for key in live_keys])
+        for name in self.TABLES:
+            cursor = connection.execute(
+                f'DELETE FROM {name} '
+                f'WHERE key NOT IN (SELECT key FROM live_keys)')
+            verbose(f'Removed {cursor.rowcount} stale {name} from {self}')
+        connection.execute('DELETE FROM live_keys')
+
+    def _exists(self) -> bool:
+        """
+        Checks whether there is anything to be looked up, so that the
+        database is not created until something is committed.
+        :return: True if the database or a JSON store to be
+                    imported exists.
+        """
+        return (self._connection is not None or self.path.exists() or
+                JsonHashStore(self.dir_path).path.exists())
+
+    def _changed(self) -> bool:
+        if self._connection is None:
+            return True
+        data_version = self._current_data_version()
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        return True
+
+    def _current_data_version(self) -> int:
+        # Changes only when the database is changed by
+        # another connection.
+        return self._connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def _dump_value(self, table: str, value: ty.Any) -> ty.Any:
+        if table in ('hashes', 'digests'):
+            return value
+        return json.dumps(self._encode(table, value))
+
+    def _load_value(self, table: str, value: ty.Any) -> ty.Any:
+        if table in ('hashes', 'digests'):
+            return bytes(value)
+        return self._decode(table, json.loads(value))
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def open_hash_store(dir_path: Path, backend: str = 'sqlite') -> 'HashStore':
+    """
+    Creates a handler of the hash store within a directory.
+
+    :param dir_path: path to directory containing the store.
+    :param backend: 'sqlite' or 'json'. If SQLite is not available,
+                the JSON store is used instead.
+    :return: HashStore
+    :raises ValueError if backend is not known.
+    """
+    if backend == 'sqlite':
+        if sqlite3 is None:
+            verbose('SQLite is not available; using JSON hash store.')
+            return JsonHashStore(dir_path)
+        return SqliteHashStore(dir_path)
+    if backend == 'json':
+        return JsonHashStore(dir_path)
+    raise ValueError(f'Unknown hash store backend: {backend}')
+
+
+#######################################################################
+# Daemon
+
+
+class Daemon:
+    """
+    Server which keeps the state of a build dir resident between runs.
+
+    Requests to meditate upon or remember the build dir are received
+    over a Unix socket, or tasks may be run directly within the
+    current process. Targets, sources, their
+    parsed content, and the hash cache are kept between runs, and
+    are only reloaded when the stat of the files they were read from
+    has changed.
+
+    Requests and responses are single lines of JSON. Requests carry
+    the build dir arguments of the client, which replace those of the
+    daemon.
+    """
+
+    TASKS = 'meditate', 'remember', 'export', 'ping', 'stop'
+
+    def __init__(
+            self,
+            path: ty.Union[str, Path],
+            watch: bool = False,
+            **build_dir_args
+    ) -> None:
+        """
+        Initializes a new daemon for a build dir.
+        :param path: path to build directory.
+        :param watch: If True, sources are watched, and hashed as soon
+                    as they are saved, rather than when the next
+                    request is received.
+        :param build_dir_args: keyword arguments used to create the
+                    BuildDir.
+        """
+        self.path = Path(path)
+        self.watch = watch
+        self.build_dir_args = build_dir_args
+        self.build_dir: ty.Optional['BuildDir'] = None
+        self.decisions: ty.Dict[
+            'CompileObject', ty.Tuple[ty.List['FileStat'], bool]] = {}
+        self._layout: ty.Dict[str, ty.Optional['FileStat']] = {}
+        self._inotify: ty.Optional['Inotify'] = None
+        self._watched_dirs: ty.Dict[int, str] = {}
+
+    @staticmethod
+    def socket_path(path: ty.Union[str, Path]) -> Path:
+        """
+        Gets the path of the socket of the daemon of a build dir.
+
+        Unix socket paths are limited to around a hundred bytes, so
+        sockets are kept in a directory of the user within the runtime
+        dir, or the temp dir if there is none, named by a hash of the
+        resolved build dir path, rather than within the build dir.
+        :param path: path to build directory.
+        :return: Path
+        """
+        runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or \
+            tempfile.gettempdir()
+        digest = hashlib.md5(str(Path(path).resolve()).encode()).hexdigest()
+        return Path(runtime_dir, f'zen-{os.getuid()}', f'{digest}.sock')
+
+    @staticmethod
+    def is_private_dir(path: Path) -> bool:
+        """
+        Checks that the passed path is a directory which belongs to
+        the user, and which cannot be accessed by any other user.
+        :param path: path to directory.
+        :return: bool
+        :raises FileNotFoundError if directory does not exist.
+        """
+        dir_stat = os.lstat(str(path))
+        return S_ISDIR(dir_stat.st_mode) and \
+            dir_stat.st_uid == os.getuid() and \
+            not dir_stat.st_mode & 0o077
+
+    @classmethod
+    def is_private(cls, path: Path) -> bool:
+        """
+        Checks that a socket belongs to the user, and is within a
+        private directory, so that a socket created by another user
+        is not trusted.
+        :param path: path to socket.
+        :return: bool
+        :raises FileNotFoundError if socket or directory does not exist.
+        """
+        return cls.is_private_dir(path.parent) and \
+            os.lstat(str(path)).st_uid == os.getuid()
+
+    @classmethod
+    def request(
+            cls,
+            path: ty.Union[str, Path],
+            task: str,
+            build_dir_args: ty.Optional[ty.Dict[str, ty.Any]] = None
+    ) -> ty.Optional[ty.Dict[str, ty.Any]]:
+        """
+        Sends a request to the daemon of the passed build dir, and waits
+        for it to be completed.
+
+        :param path: path to build directory.
+        :param task: name of task to be run by daemon.
+        :param build_dir_args: keyword arguments used to create the
+                    BuildDir, which the daemon uses in place of its own.
+        :return: response dict, or None if no daemon could be reached.
+        """
+        request = {'task': task}
+        if build_dir_args is not None:
+            request['args'] = build_dir_args
+        socket_path = cls.socket_path(path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            try:
+                if not cls.is_private(socket_path):
+                    verbose(f'Not connecting to {socket_path}; '
+                            'it may belong to another user.')
+                    return None
+                client.connect(str(socket_path))
+            except OSError:  # Not running, or socket path is unusable.
+                return None
+            with client.makefile('rw') as f:
+                f.write(json.dumps(request) + '\n')
+                f.flush()
+                line = f.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def serve(self) -> None:
+        """
+        Handles requests until a stop request is received.
+        :return: None
+        :raises ValueError if a daemon is already running, or if the
+                    directory of the socket is not private to the user.
+        """
+        path = self.socket_path(self.path)
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not self.is_private_dir(path.parent):
+            raise ValueError(f'Socket directory {path.parent} is not private')
+        if path.exists():
+            if self.request(self.path, 'ping') is not None:
+                raise ValueError(f'Daemon already running for {self.path}')
+            path.unlink()  # Left behind by a daemon that did not exit.
+        if self.watch:
+            self._inotify = Inotify()
+            self._watch_sources(self.current_build_dir())
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(str(path))
+            try:
+                server.listen()
+                verbose(f'{repr(self)} listening on {path}')
+                while True:
+                    readable = [server]
+                    if self._inotify is not None:
+                        readable.append(self._inotify)
+                    readable, _, _ = select.select(readable, [], [])
+                    if self._inotify in readable:
+                        self.prehash(self._changed_paths())
+                    if server in readable:
+                        connection, _ = server.accept()
+                        with connection:
+                            if not self._handle(connection):
+                                break
+            finally:
+                path.unlink()
+                if self._inotify is not None:
+                    self._inotify.close()
+                    self._inotify = None
+                    self._watched_dirs.clear()
+
+    def run_task(self, task: str) -> None:
+        """
+        Runs a task within the current process.
+        :param task: name of task.
+        :return: None
+        :raises ValueError if task is not known.
+        """
+        if task == 'meditate':
+            build_dir = self.current_build_dir()
+            build_dir.meditate(self.ready_decisions())
+        elif task == 'remember':
+            self.current_build_dir().remember()
+            self.decisions.clear()  # Made against the old hashes.
+        elif task == 'export':
+            self.current_build_dir().export()
+        elif task not in self.TASKS:
+            raise ValueError(f'Unknown task: {task}')
+
+    def configure(self, build_dir_args: ty.Dict[str, ty.Any]) -> None:
+        """
+        Replaces the arguments used to create the BuildDir with those
+        of a client, so that the options of each run take effect when
+        the run is served by the daemon.
+
+        The resident build dir is loaded again only if the backend of
+        its hash store changes.
+        :param build_dir_args: keyword arguments used to create the
+                    BuildDir.
+        :return: None
+        """
+        if build_dir_args == self.build_dir_args:
+            return
+        old_backend = self.build_dir_args.get('cache_backend', 'sqlite')
+        self.build_dir_args = dict(build_dir_args)
+        if self.build_dir is None:
+            return
+        if build_dir_args.get('cache_backend', 'sqlite') != old_backend:
+            self.build_dir.store.close()
+            self.build_dir = None
+            return
+        self.build_dir.precise_m_time = \
+            build_dir_args.get('precise_m_time', False)
+        self.build_dir.jobs = build_dir_args.get('jobs', 1)
+
+    def current_build_dir(self) -> 'BuildDir':
+        """
+        Gets the resident build dir, ready to be run.
+
+        Targets are found again only if files describing the layout of
+        the build have changed since they were last found.
+        :return: BuildDir
+        """
+        layout = self._layout_stats()
+        if self.build_dir is None or layout != self._layout:
+            verbose(f'{repr(self)} loading build dir.')
+            self.build_dir = BuildDir(str(self.path), **self.build_dir_args)
+            self._layout = self._layout_stats()
+            self.decisions.clear()
+            if self._inotify is not None:
+                self._watch_sources(self.build_dir)
+        else:
+            self.build_dir.reset()
+        return self.build_dir
+
+    def prehash(self, paths: ty.Iterable[Path]) -> None:
+        """
+        Hashes the content of the passed source files, and the used
+        content of the objects which depend upon them, so that the
+        hashes are ready when the next request is received.
+
+        Whether each of those objects must be rebuilt is recorded in
+        decisions, along with the stats of its sources, so that the
+        next meditation need only apply the decision.
+
+        :param paths: paths of changed source files.
+        :return: None
+        """
+        build_dir = self.current_build_dir()
+        for path in paths:
+            try:
+                source = build_dir.sources_by_path[path]
+            except KeyError:
+                continue  # Not a source of the build.
+            dependents = build_dir.dependents[source]
+            verbose(f'{repr(self)} hashing {source}')
+            for obj in dependents:
+                self.decisions.pop(obj, None)
+            try:
+                source.stripped_hash
+                for obj in dependents:
+                    stats = [dep.stat for dep in obj.sources]
+                    self.decisions[obj] = \
+                        stats, obj.has_substantive_changes()
+            except Exception as e:  # Raised again when meditating.
+                verbose(f'{repr(self)} could not hash {source}: {e}')
+
+    def ready_decisions(self) -> ty.Dict['CompileObject', bool]:
+        """
+        Gets the decisions made by prehash which are still current,
+        as no source of their object has changed since.
+        :return: whether each decided object must be rebuilt.
+        """
+        ready = {}
+        for obj, (stats, changed) in self.decisions.items():
+            try:
+                if stats == [source.stat for source in obj.sources]:
+                    ready[obj] = changed
+            except FileNotFoundError:
+                continue
+        verbose(f'{repr(self)} has {len(ready)} decisions ready.')
+        return ready
+
+    def _watch_sources(self, build_dir: 'BuildDir') -> None:
+        """
+        Watches the directories of all sources of the build dir.
+
+        Directories are watched rather than files, so that files saved
+        by replacing them are still seen.
+        :param build_dir: BuildDir
+        :return: None
+        """
+        watched = set(self._watched_dirs.values())
+        for dir_path in {str(source.path.parent)
+                         for source in build_dir.sources}:
+            if dir_path in watched:
+                continue
+            try:
+                wd = self._inotify.add_watch(dir_path, Inotify.FILE_CHANGES)
+            except FileNotFoundError:
+                continue
+            self._watched_dirs[wd] = dir_path
+
+    def _changed_paths(self) -> ty.Set[Path]:
+        """
+        Reads pending inotify events.
+        :return: paths of changed files within watched directories.
+        """
+        paths = set()
+        for wd, _, name in self._inotify.read_events():
+            try:
+                dir_path = self._watched_dirs[wd]
+            except KeyError:
+                continue
+            if name:
+                paths.add(Path(dir_path, name))
+        return paths
+
+    def _handle(self, connection: socket.socket) -> bool:
+        """
+        Handles a single request.
+        :param connection: socket connected to client.
+        :return: False if the daemon should stop.
+        """
+        with connection.makefile('rw') as f:
+            task = None
+            try:
+                request = json.loads(f.readline())
+                task = request['task']
+                if 'args' in request:
+                    self.configure(request['args'])
+                self.run_task(task)
+                response = {'ok': True}
+            except Exception as e:  # Reported to client.
+                response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+            f.write(json.dumps(response) + '\n')
+        return task != 'stop'
+
+    def _layout_stats(self) -> ty.Dict[str, ty.Optional['FileStat']]:
+        """
+        Gets stats of the files that describe the layout of the build.
+        :return: dict of FileStats, or None for missing files, by path.
+        """
+        paths = [Path(self.path, 'CMakeFiles', 'Makefile.cmake')]
+        if self.build_dir is not None:
+            for target in self.build_dir.targets.values():
+                paths += [Path(target.path, name) for name in (
+                    'depend.internal', 'build.make', 'cmake_clean.cmake')]
+        stats = {}
+        for path in paths:
+            try:
+                stats[str(path)] = FileStat.of(path)
+            except FileNotFoundError:
+                stats[str(path)] = None
+        return stats
+
+    def __repr__(self) -> str:
+        return f'Daemon[{self.path}]'
+
+
+class Inotify:
+    """
+    Minimal binding of the Linux inotify API.
+    """
+
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    FILE_CHANGES = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+    def __init__(self) -> None:
+        """
+        Creates a new inotify instance.
+        :raises OSError if inotify is not available.
+        """
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            init = self._libc.inotify_init1
+        except AttributeError as e:
+            raise OSError('inotify is not available.') from e
+        self.fd = init(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: ty.Union[str, Path], mask: int) -> int:
+        """
+        Watches the passed path for events.
+        :param path: path to file or directory.
+        :param mask: int flags of events to watch for.
+        :return: int watch descriptor.
+        :raises OSError if the path cannot be watched.
+        """
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(str(path)), ctypes.c_uint32(mask))
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        return wd
+
+    def read_events(self) -> ty.List[ty.Tuple[int, int, str]]:
+        """
+        Reads all pending events, without blocking.
+        :return: List of (watch descriptor, mask, name) tuples.
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            i = 0
+            while i < len(data):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, i)
+                i += self.EVENT_HEADER.size
+                name = os.fsdecode(data[i:i + length].rstrip(b'\0'))
+                i += length
+                events.append((wd, mask, name))
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def __repr__(self) -> str:
+        return f'Inotify[{self.fd}]'
 
 
 #######################################################################
@@ -2160,22 +4922,139 @@ def clear() -> None:
     SourceFile.clear()
 
 
+def run_task(daemon: 'Daemon', task: str, use_daemon: bool = True) -> None:
+    """
+    Runs a task in the daemon serving the build dir, if one is running,
+    or else within this process.
+
+    :param daemon: Daemon used to run the task within this process.
+    :param task: name of task.
+    :param use_daemon: If False, the task is always run within
+                this process.
+    :return: None
+    :raises RuntimeError if the task failed within a serving daemon.
+    """
+    if use_daemon:
+        response = Daemon.request(daemon.path, task, daemon.build_dir_args)
+        if response is not None:
+            if not response['ok']:
+                raise RuntimeError(response['error'])
+            return
+    daemon.run_task(task)
+
+
+def make(
+        daemon: 'Daemon',
+        make_args: ty.List[str],
+        use_daemon: bool = True
+) -> int:
+    """
+    Meditates upon the build dir, builds it with make, and then
+    remembers it if the build succeeded.
+
+    Both tasks are run by the same daemon, so sources parsed while
+    meditating are reused while remembering, and only sources modified
+    during the build are parsed again.
+
+    :param daemon: Daemon used to run tasks within this process.
+    :param make_args: arguments passed to make.
+    :param use_daemon: If False, tasks are always run within
+                this process.
+    :return: exit code of make.
+    :rtype: int
+    """
+    run_task(daemon, 'meditate', use_daemon)
+    result = sub.run(['make'] + make_args, cwd=str(daemon.path))
+    if result.returncode == 0:
+        run_task(daemon, 'remember', use_daemon)
+    return result.returncode
+
+
+def _add_options(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options of zen itself to the passed parser.
+    :param parser: ArgumentParser
+    :return: None
+    """
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument(
+        '--no-daemon', action='store_true',
+        help='Run in this process even if a daemon is serving the '
+             'build dir.')
+    parser.add_argument(
+        '--precise-mtime', action='store_true',
+        help='Set modification times of files whose build is avoided '
+             'to just after those of their newest dependencies, rather '
+             'than to the current time.')
+    parser.add_argument(
+        '-j', '--jobs', type=int,
+        help='Number of processes used to parse and hash sources.')
+    parser.add_argument(
+        '--cache', choices=('sqlite', 'json'),
+        help='Backend of the store of remembered hashes. The export '
+             'task copies the store to the JSON backend.')
+
+
+def parse_args(args: ty.Optional[ty.List[str]] = None) -> argparse.Namespace:
+    """
+    Parses command line arguments.
+    :param args: arguments to parse; those of the process by default.
+    :return: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(description='Focus compilation')
+    _add_options(parser)
+    parser.set_defaults(jobs=1, cache='sqlite')
+    # Options may also follow the build dir of each task but make,
+    # which passes everything following its build dir to make. Their
+    # defaults are suppressed, so that they do not replace options
+    # passed before the task.
+    task_options = argparse.ArgumentParser(
+        add_help=False, argument_default=argparse.SUPPRESS)
+    _add_options(task_options)
+    tasks = parser.add_subparsers(dest='task', metavar='task')
+    tasks.required = True
+    for task in ('meditate', 'remember', 'export', 'serve', 'watch',
+                 'stop'):
+        tasks.add_parser(task, parents=[task_options]).add_argument(
+            'build_dir')
+    make_parser = tasks.add_parser('make')
+    make_parser.add_argument('build_dir')
+    make_parser.add_argument(
+        'make_args', nargs=argparse.REMAINDER,
+        help='Arguments passed to make. Options for zen itself must '
+             'precede the task.')
+    return parser.parse_args(args)
+
+
 def main():
     global verbose_opt
-    parser = argparse.ArgumentParser(description='Focus compilation')
-    parser.add_argument('task')
-    parser.add_argument('build_dir')
-    parser.add_argument('-v', '--verbose', action='store_true')
-    user_args = parser.parse_args()
-    build_dir = BuildDir(user_args.build_dir)
-    if user_args.task == 'meditate':
-        build_dir.meditate()
-    elif user_args.task == 'remember':
-        build_dir.remember()
+    user_args = parse_args()
     verbose_opt = user_args.verbose
+    build_dir_args = {
+        'precise_m_time': user_args.precise_mtime,
+        'jobs': user_args.jobs,
+        'cache_backend': user_args.cache
+    }
+    daemon = Daemon(
+        user_args.build_dir,
+        watch=user_args.task == 'watch',
+        **build_dir_args
+    )
+    if user_args.task in ('serve', 'watch'):
+        daemon.serve()
+        return
+    use_daemon = not user_args.no_daemon
+    try:
+        if user_args.task == 'make':
+            sys.exit(make(daemon, user_args.make_args, use_daemon))
+        run_task(daemon, user_args.task, use_daemon)
+    except RuntimeError as e:
+        sys.exit(f'zen: {e}')
 
 
 verbose_opt = False
+worker_parse_cache: ty.Optional['ParseCache'] = None
+worker_stat_cache: ty.Optional['StatCache'] = None
 
 
 if __name__ == '__main__':